@@ -3,9 +3,13 @@
 # $Id: iconmaker.py 477 2005-07-29 21:22:08Z aafshar $
 import gtk
 import os
+import sys
 import shelve
 import shutil
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import iconatlas
+
 I = gtk.IconTheme()
 I.set_custom_theme('Rodent')
 
@@ -14,12 +18,15 @@ try:
     shutil.rmtree('iconbuild')
 except:
     pass
-try:
-    os.remove('icons.dat')
-except:
-    pass
+for fn in ['icons.dat', 'icons.atlas']:
+    try:
+        os.remove(fn)
+    except:
+        pass
 os.mkdir('iconbuild')
+# The shelve is still written for older versions of Pida
 outfile = shelve.open('icons.dat')
+atlas = []
 for line in f:
     name, key = [s.strip() for s in line.split(' ')]
     i = I.load_icon(name, 15, 0)
@@ -31,14 +38,16 @@ for line in f:
     h = i.get_height()
     rs = i.get_rowstride()
     outfile[key] = d, (ha, bp, w, h, rs)
+    atlas.append((key, d, (ha, bp, w, h, rs)))
 outfile.close()
+iconatlas.write_atlas('icons.atlas', atlas)
 w = gtk.Window()
 w.connect('destroy', gtk.main_quit)
 b = gtk.HBox()
 w.add(b)
-outfile = shelve.open('icons.dat')
+outfile = iconatlas.IconAtlas('icons.atlas')
 cs = gtk.gdk.COLORSPACE_RGB
-for i in outfile:
+for i in outfile.keys():
     d, a = outfile[i]
     pb = gtk.gdk.pixbuf_new_from_data(d, cs, *a)
     im = gtk.Image()
@@ -65,11 +65,18 @@ packages = ['pida',
             'pida.plugins']
 
 log('Preparing plugins')
+package_data = {}
 plugindir = os.path.join('src', 'plugins')
 for plugin in os.listdir(plugindir):
     if not plugin[0] in ['.', '_']:
         log('Adding plugin "%s"' % plugin)
         packages.append('pida.plugins.%s' % plugin)
+        if os.path.exists(os.path.join(plugindir, plugin, 'manifest')):
+            package_data['pida.plugins.%s' % plugin] = ['manifest']
+
+log('Preparing data')
+# icons.dat is converted to an icon atlas in ~/.pida on first run
+data_files = ['data/icons.dat', 'data/pidalogo.png']
 
 log('Performing setup.')
 setup(name='pida',
@@ -82,10 +89,10 @@ setup(name='pida',
                  'which uses Vim as its editor.'),
     long_description='Please visit the Pida website for more details.',
     packages=packages,
+    package_data=package_data,
     package_dir = {'pida': 'src'},
     scripts=['scripts/pida'],
-    data_files=[(os.path.join('share', 'pida'), ['data/icons.dat',
-                                                 'data/pidalogo.png'])],
+    data_files=[(os.path.join('share', 'pida'), data_files)],
     classifiers=[
         'Development Status :: 4 - Beta',
         'Environment :: X11 Applications',
@@ -79,6 +79,9 @@ class pidaobject(object):
     def do_get_image(self, stockname):
         return self.pida.boss.icons.get_image(stockname)
 
+    def do_get_pixbuf(self, stockname):
+        return self.pida.boss.icons.get(stockname)
+
     def do_get_button(self, stockname):
         return self.pida.boss.icons.get_button(stockname)
 
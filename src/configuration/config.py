@@ -411,7 +411,8 @@ class ConfigEditor(base.pidaobject):
         self.win = gtk.Window()
         self.win.set_title('PIDA Configuration Editor')
         self.win.set_transient_for(self.pida.mainwindow)
-        self.win.connect('destroy', self.cb_cancel)
+        # closing only hides, the editor is kept for the next time
+        self.win.connect('delete-event', self.cb_delete)
         # top container
         hbox = gtk.HBox()
         self.win.add(hbox)
@@ -424,6 +425,7 @@ class ConfigEditor(base.pidaobject):
         self.nb = gtk.Notebook()
         vbox.pack_start(self.nb, padding=4)
         self.nb.set_show_tabs(False)
+        self.nb.connect('switch-page', self.cb_switch_page)
         # Button Bar
         cb = gtk.HBox()
         vbox.pack_start(cb, expand=False, padding=2)
@@ -446,7 +448,12 @@ class ConfigEditor(base.pidaobject):
         self.save_b = gtk.Button(stock=gtk.STOCK_SAVE)
         cb.pack_start(self.save_b, expand=False)
         self.save_b.connect('clicked', self.cb_save)
+        # Controls of the pages built so far
         self.controls = {}
+        self.pages = []
+        self.paged_groups = {}
+        # tabid -> (box, group) of the pages not built yet
+        self.unbuilt_pages = {}
         
         self.setopts()
         self.initialize()
@@ -456,36 +463,45 @@ class ConfigEditor(base.pidaobject):
 
     def initialize(self):
         """
-        Load the initial database options into the config editor, and generate
-        the required widgets.
+        Add an empty page for each registry group without one. The widgets
+        of a page are only built when it is first shown, see L{build_page}.
         """
-        pages = []
         for group in self.registry.iter_groups():
-        
-        #sects =  self.opts.sections()
-        #sects.sort()
-        #for section in sects:
+            if group._name in self.paged_groups:
+                continue
+            self.paged_groups[group._name] = True
             box = gtk.VBox()
             sectlab = ''.join([group._name[0].upper(), group._name[1:]])
             sectdoc = gtk.Label(group._doc)
             box.pack_start(sectdoc, expand=False)
             
             tabid = self.nb.append_page(box, gtk.Label(sectlab))
-            pages.append((sectlab, tabid))
-            for option in group:
-                #ctype = TYPES[self.get_type(section, opt)]
-                cw = option.DISPLAY_WIDGET(option)
-                box.pack_start(cw.win, expand=False, padding=4)
-                self.controls[(group._name, option._name)] = cw
-                box.pack_start(gtk.HSeparator(), expand=False, padding=4)
-        self.tree.populate(pages)
+            self.pages.append((sectlab, tabid))
+            self.unbuilt_pages[tabid] = (box, group)
+        self.tree.populate(self.pages)
+
+    def build_page(self, tabid):
+        """
+        Generate the widgets of a page, if they have not been yet.
+        """
+        if not tabid in self.unbuilt_pages:
+            return
+        box, group = self.unbuilt_pages.pop(tabid)
+        for option in group:
+            cw = option.DISPLAY_WIDGET(option)
+            box.pack_start(cw.win, expand=False, padding=4)
+            self.controls[(group._name, option._name)] = cw
+            box.pack_start(gtk.HSeparator(), expand=False, padding=4)
+            cw.load()
+        box.show_all()
 
     def get_type(self, section, option):
         return self.opts.types[(section, option)]
 
     def load(self):
         """
-        Load the configuration information from the database.
+        Load the configuration information from the database, into the
+        pages which have been built.
         """
         #for group, option in self.registry.iter_items():
         #for section in self.opts.sections():
@@ -495,7 +511,8 @@ class ConfigEditor(base.pidaobject):
 
     def save(self):
         """
-        Save the configuration information to the database.
+        Save the configuration information of the pages which have been
+        built to the database.
         """
         for k in self.controls:
             self.controls[k].save()
@@ -504,11 +521,15 @@ class ConfigEditor(base.pidaobject):
         #    for opt in self.opts.options(section):
         #        self.controls[(section, opt)].save()
         #self.opts.write()
-        self.do_evt('reset')
+        # Only the subscribers of the changed options are called
+        self.registry.notify()
 
     def show(self, pagename=None):
+        # groups may have been added since the last time
+        self.initialize()
         self.load()
         self.win.show_all()
+        self.build_page(self.nb.get_current_page())
         if pagename:
             for row in self.tree.get_model():
                 name, i = row
@@ -518,12 +539,18 @@ class ConfigEditor(base.pidaobject):
                     break
 
     def hide(self):
-        self.win.hide_all()
-        self.win.destroy()
+        self.win.hide()
 
     def cb_select(self, tid):
         self.nb.set_current_page(tid)
 
+    def cb_switch_page(self, notebook, page, tid):
+        self.build_page(tid)
+
+    def cb_delete(self, *args):
+        self.hide()
+        return True
+
     def cb_reset(self, *args):
         self.show()
 
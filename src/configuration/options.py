@@ -31,19 +31,6 @@ import ConfigParser as configparser
 # The pida registry
 import registry
 
-def which(name):
-    ''' Returns the path of the application named name using 'which'. '''
-    p = os.popen('which %s' % name)
-    w = p.read().strip()
-    p.close()
-    if len(w):
-        if 'command not found' in w:
-            return None
-        else:
-            return w
-    else:
-        return None
-
 def configure(reg):
     """
     Default global configuration.
@@ -67,6 +54,11 @@ def configure(reg):
                  registry.CreatingDirectory,
                  os.path.join(dirs_user._default, '.sockets'),
                  'Where Pida will start Unix Domain Sockets')
+
+    dirs_index = dirs_group.add('index',
+                 registry.CreatingDirectory,
+                 os.path.join(dirs_user._default, 'index'),
+                 'Where the file indexes of projects are kept')
                  
  #       ### Files
     file_group = reg.add_group('files',
@@ -148,6 +140,55 @@ def configure(reg):
 
     log_level.adjustment = (10, 50, 10)
 
+    evts_group = reg.add_group('events',
+                               'Options for event delivery to plugins.')
+
+    evts_coal = evts_group.add('coalesce',
+                   registry.Boolean,
+                   0,
+                   'Whether bursts of buffer events from the editor are '
+                   'delivered once, when Pida is idle.')
+
+    evts_inst = evts_group.add('instrument',
+                   registry.Boolean,
+                   0,
+                   'Whether the time taken by each plugin to handle events '
+                   'is recorded (see the debug window).')
+
+    wdog_group = reg.add_group('watchdog',
+                               'Detecting when the user interface freezes.')
+
+    wdog_enab = wdog_group.add('enabled',
+                   registry.Boolean,
+                   0,
+                   'Whether the time Pida is blocked is watched and logged '
+                   '(requires restart).')
+
+    wdog_thre = wdog_group.add('threshold',
+                   registry.Integer,
+                   2000,
+                   'The time in milliseconds after which Pida is considered '
+                   'blocked.')
+
+    wdog_thre.adjustment = (100, 60000, 100)
+
+    rel_group = reg.add_group('reload',
+                              'Applying files edited outside Pida.')
+
+    rel_enab = rel_group.add('enabled',
+                   registry.Boolean,
+                   1,
+                   'Whether the config, projects and shortcuts files are '
+                   'watched, and reloaded when changed (requires restart).')
+
+    rel_intv = rel_group.add('interval',
+                   registry.Integer,
+                   2000,
+                   'The time in milliseconds between checks for changes '
+                   '(requires restart).')
+
+    rel_intv.adjustment = (250, 60000, 250)
+
     lay_group = reg.add_group('layout', 'Thigs to do with layout')
 
     lay_max = lay_group.add('start_maximised',
@@ -24,6 +24,7 @@
 
 import os
 import config
+import cPickle as pickle
 import ConfigParser as configparser
 
 class BadRegistryKey(Exception):
@@ -44,12 +45,20 @@ class BadRegistryDefault(Exception):
 
 class RegistryItem(object):
     DISPLAY_WIDGET = config.ConfigEntry
+    # Whether validity depends on the filesystem, so values restored from a
+    # snapshot are validated again
+    REVALIDATE = False
 
     def __init__(self, name, default, doc):
         self._name = name
         self.doc = doc
         self._value = None
         self._default = default
+        self._subscribers = []
+        # Whether the value differs from the file, and whether the
+        # subscribers have been told of the last change
+        self._dirty = False
+        self._changed = False
 
     def setdefault(self):
         self.set(self._default)
@@ -77,13 +86,38 @@ class RegistryItem(object):
 
     def set(self, value):
         if self.validate(value):
-            self._value = value
+            if value != self._value:
+                self._value = value
+                self._dirty = self._changed = True
         else:
             raise BadRegistryValue, value
 
     def value(self):
         return self._value
 
+    def restore(self, value):
+        """
+        Set an already validated value, such as one from a snapshot.
+        """
+        self._value = value
+
+    def subscribe(self, callback):
+        """
+        Call callback when the value changes, see L{Registry.notify}.
+        """
+        if not callback in self._subscribers:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def schema(self):
+        """
+        Return what a stored value for this item depends on.
+        """
+        return (self.__class__.__name__, self._default)
+
     def __repr__(self):
         return ('Registry Value typ=%s name=%s value=%s default=%s '
                 'doc=%s' % (self.__class__.__name__, self._name,
@@ -95,30 +129,57 @@ class RegistryGroup(object):
     def __init__(self, name, doc):
         self._name = name
         self._doc = doc
+        # Items in the order they were declared, and by name
+        self._items = []
+        self._index = {}
 
     def add(self, name, typ, default, doc):
         try:
             entry = typ(name, default, doc)
-            setattr(self, name, entry)
-            return entry
         except BadRegistryDefault:
             return False
+        if name in self._index:
+            self._items.remove(self._index[name])
+        self._items.append(entry)
+        self._index[name] = entry
+        setattr(self, name, entry)
+        return entry
+
+    def add_data(self, name, typ, data, doc):
+        """
+        Add an item whose default is given in serialized form, as it would
+        be in a config file.
+        """
+        entry = self.add(name, typ, data, doc)
+        if entry:
+            entry._default = entry.unserialize(data)
+        return entry
 
     def delete(self, name):
+        self._items.remove(self._index.pop(name))
         delattr(self, name)
 
     def __iter__(self):
-        for child in dir(self):
-            obj = getattr(self, child)
-            if isinstance(obj, RegistryItem):
-                yield obj
-        
+        return iter(list(self._items))
+
+    def __contains__(self, childname):
+        return childname in self._index
+
     def get(self, childname):
-        if hasattr(self, childname):
-            return getattr(self, childname)
-        else:
+        try:
+            return self._index[childname]
+        except KeyError:
             raise BadRegistryKey, '"%s"' % childname
 
+    def get_many(self, *childnames):
+        """
+        Return the values of several items at once.
+
+        @return: The values, in the order of the names given.
+        @rtype: C{list}
+        """
+        return [self.get(childname).value() for childname in childnames]
+
     def _get_doc(self):
         return self._doc
 
@@ -126,6 +187,7 @@ class RegistryGroup(object):
 
 class Directory(RegistryItem):
     DISPLAY_WIDGET = config.ConfigFolder
+    REVALIDATE = True
     def validate(self, value):
         return os.path.isdir(value)
         
@@ -142,6 +204,7 @@ class File(RegistryItem):
     pass
 
 class MustExistFile(File):
+    REVALIDATE = True
 
     def validate(self, value):
         return os.path.exists(value)
@@ -189,17 +252,79 @@ class Registry(object):
     def __init__(self, filename):
         self.filename = filename
         self.optparseopts = {}
+        self.profile_startup = False
+        self.profile_dump = None
+        # Groups in the order they were declared, and by name
+        self._groups = []
+        self._group_index = {}
 
     def add_group(self, name, doc):
         group = RegistryGroup(name, doc)
+        if name in self._group_index:
+            self._groups.remove(self._group_index[name])
+        self._groups.append(group)
+        self._group_index[name] = group
         setattr(self, name, group)
         return group
 
+    def get_group(self, name):
+        try:
+            return self._group_index[name]
+        except KeyError:
+            raise BadRegistryKey, '"%s"' % name
+
+    def get_many(self, *keys):
+        """
+        Return the values of several items given as (group, item) pairs.
+
+        @return: The values, in the order of the keys given.
+        @rtype: C{list}
+        """
+        return [self.get_group(groupname).get(childname).value()
+                for groupname, childname in keys]
+
     def iter_groups(self):
-        for name in dir(self):
-            obj = getattr(self, name)
-            if isinstance(obj, RegistryGroup):
-                yield obj
+        return iter(list(self._groups))
+
+    def subscribe(self, callback, *keys):
+        """
+        Subscribe to changes of the items given as (group, item) pairs.
+
+        @param callback: Called with the list of changed items.
+        """
+        for groupname, childname in keys:
+            self.get_group(groupname).get(childname).subscribe(callback)
+
+    def unsubscribe(self, callback, *keys):
+        for groupname, childname in keys:
+            self.get_group(groupname).get(childname).unsubscribe(callback)
+
+    def notify(self):
+        """
+        Call the subscribers of the items changed since the last notify.
+
+        Each subscriber is called once, with all the changed items it is
+        subscribed to.
+        """
+        callbacks = []
+        changed = {}
+        for group, option in self.iter_items():
+            if not option._changed:
+                continue
+            option._changed = False
+            for callback in option._subscribers:
+                if not callback in changed:
+                    callbacks.append(callback)
+                    changed[callback] = []
+                changed[callback].append(option)
+        for callback in callbacks:
+            callback(changed[callback])
+
+    def is_dirty(self):
+        for group, option in self.iter_items():
+            if option._dirty:
+                return True
+        return False
 
     def iter_items(self):
         for group in self.iter_groups():
@@ -218,25 +343,106 @@ class Registry(object):
         for group, option in self.iter_items():
             if tempopts.has_option(group._name, option._name):
                 data = tempopts.get(group._name, option._name)
-                if not option.load(data):
-                    option.setdefault()
-            else:
-                option.setdefault()
+                if option.load(data):
+                    option._dirty = False
+                    continue
+            # Missing or invalid in the file, so it must be rewritten
+            option.setdefault()
+            option._dirty = True
+
+    def get_snapshot_filename(self):
+        return '%s.snapshot' % self.filename
+
+    def get_file_stamp(self):
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size
+
+    def read_snapshot(self):
+        """
+        Return the snapshot values, if they are still fresh for the file.
+
+        @return: C{(group name, item name) -> (schema, value)}
+        @rtype: C{dict}
+        """
+        try:
+            f = open(self.get_snapshot_filename(), 'rb')
+            try:
+                version, stamp, values = pickle.load(f)
+            finally:
+                f.close()
+        except Exception:
+            return {}
+        if version != SNAPSHOT_VERSION or stamp != self.get_file_stamp():
+            return {}
+        return values
+
+    def load_snapshot(self):
+        """
+        Load every item from the snapshot, if it holds all of them.
+
+        @return: Whether the items were loaded.
+        """
+        values = self.read_snapshot()
+        loaded = []
+        for group, option in self.iter_items():
+            snap = values.get((group._name, option._name))
+            if snap is None or snap[0] != option.schema():
+                return False
+            if option.REVALIDATE:
+                # Creating directories are created again if removed
+                try:
+                    if not option.validate(snap[1]):
+                        return False
+                except (IOError, OSError):
+                    return False
+            loaded.append((option, snap[1]))
+        for option, value in loaded:
+            option.restore(value)
+        return True
+
+    def save_snapshot(self):
+        """
+        Save the validated values, which must match the file.
+        """
+        # Keep the values of items not declared now, they may be declared
+        # for the next load
+        values = self.read_snapshot()
+        for group, option in self.iter_items():
+            values[(group._name, option._name)] = (option.schema(),
+                                                  option.value())
+        try:
+            f = open(self.get_snapshot_filename(), 'wb')
+            pickle.dump((SNAPSHOT_VERSION, self.get_file_stamp(), values), f,
+                        pickle.HIGHEST_PROTOCOL)
+            f.close()
+        except (IOError, OSError, pickle.PicklingError):
+            pass
 
     def load_opts(self):
         for k in self.optparseopts:
             groupname, childname = k
             data = self.optparseopts[k]
-            group = getattr(self, groupname)
-            option = getattr(group, childname)
+            option = self.get_group(groupname).get(childname)
             option.load(data)
 
     def load(self):
-        self.load_file()
+        # Only parse and validate the file when it has changed
+        if not self.load_snapshot():
+            self.load_file()
+            self.save_snapshot()
         self.load_opts()
+        self.notify()
+        which_cache.save()
 
     def save(self):
-        f = open(self.filename, 'w')
+        if not self.is_dirty() and os.path.exists(self.filename):
+            return
+        # Written aside and renamed, so the file is never left half written
+        tempname = '%s.tmp' % self.filename
+        f = open(tempname, 'w')
         f.write(CONFIG_FILE_INTRO)
         for group in self.iter_groups():
             f.write('\n[%s]\n' % group._name)
@@ -246,6 +452,10 @@ class Registry(object):
                 f.write('# default value = %s\n' % option._default)
                 f.write('%s = %s\n\n' % (option._name, option.value()))
         f.close()
+        os.rename(tempname, self.filename)
+        for group, option in self.iter_items():
+            option._dirty = False
+        self.save_snapshot()
 
     def prime_optparser(self, optparser):
         if hasattr(optparser, 'add_option'):
@@ -259,21 +469,119 @@ class Registry(object):
                         self.optparseopts[(group, child)] = value
             optparser.add_option('-f', '--registry-file', type='string', nargs=1,
                                  action='callback', callback=setfilename)
+            def setprofile(opt, opt_str, value, parser):
+                self.profile_startup = True
+            def setprofiledump(opt, opt_str, value, parser):
+                self.profile_startup = True
+                self.profile_dump = value
             optparser.add_option('-c', '--config', type='string', nargs=1,
                                  action='callback', callback=setitem)
+            optparser.add_option('--profile-startup', action='callback',
+                                 callback=setprofile,
+                                 help='Print the time taken by each phase '
+                                      'of startup.')
+            optparser.add_option('--profile-startup-dump', type='string',
+                                 nargs=1, action='callback',
+                                 callback=setprofiledump, metavar='FILE',
+                                 help='Also write profiler stats for the '
+                                      'whole startup to FILE.')
             
-def which(name):
-    ''' Returns the path of the application named name using 'which'. '''
-    p = os.popen('which %s' % name)
-    w = p.read().strip()
-    p.close()
-    if len(w):
-        if 'command not found' in w:
-            return None
-        else:
-            return w
-    else:
+def search_path(name, path=None):
+    """
+    Return the path of the executable named name on the search path.
+
+    @param path: The search path, defaults to $PATH.
+    @type path: string
+    """
+    if not name:
         return None
+    if os.path.dirname(name):
+        candidates = [name]
+    else:
+        if path is None:
+            path = os.environ.get('PATH', os.defpath)
+        candidates = [os.path.join(d, name) for d in path.split(os.pathsep)
+                      if d]
+    for candidate in candidates:
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return candidate
+    return None
+
+class WhichCache(object):
+    """
+    A persistent cache of searches for executables on the search path.
+
+    The cache is thrown away when $PATH, or the modification time of any of
+    its directories, has changed.
+    """
+
+    # Change this when the pickled format changes
+    VERSION = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.paths = None
+        self.stamp = None
+        self.dirty = False
+
+    def get_stamp(self):
+        path = os.environ.get('PATH', os.defpath)
+        mtimes = []
+        for d in path.split(os.pathsep):
+            try:
+                mtimes.append((d, os.stat(d).st_mtime))
+            except OSError:
+                mtimes.append((d, None))
+        return path, tuple(mtimes)
+
+    def load(self):
+        self.stamp = self.get_stamp()
+        self.paths = {}
+        try:
+            f = open(self.filename, 'rb')
+            try:
+                version, stamp, paths = pickle.load(f)
+            finally:
+                f.close()
+        except Exception:
+            # Missing or unreadable, it will be rebuilt
+            return
+        if version == self.VERSION and stamp == self.stamp:
+            self.paths = paths
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        try:
+            cachedir = os.path.dirname(self.filename)
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+            f = open(self.filename, 'wb')
+            pickle.dump((self.VERSION, self.stamp, self.paths), f,
+                        pickle.HIGHEST_PROTOCOL)
+            f.close()
+        except (IOError, OSError):
+            pass
+
+    def which(self, name):
+        # The cache is checked against the search path once per run
+        if self.paths is None:
+            self.load()
+        if not name in self.paths:
+            self.paths[name] = search_path(name)
+            # Written once the registry has loaded, not on every miss
+            self.dirty = True
+        return self.paths[name]
+
+which_cache = WhichCache(os.path.expanduser('~/.pida/which.cache'))
+
+def which(name):
+    ''' Returns the path of the application named name on the search path. '''
+    return which_cache.which(name)
+
+# Change this when the pickled snapshot format changes
+SNAPSHOT_VERSION = 1
 
 CONFIG_FILE_INTRO = ('#This is an automatically generated Pida config file.\n'
              '#Please edit it, your changes will be preserved (if valid).\n'
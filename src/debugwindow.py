@@ -117,6 +117,23 @@ class DebugWindow(gtk.Dialog):
         
         isw.add(self._iview)
         self.notebook.append_page(isw, tab_label=gtk.Label("Stdio"))
+
+        hsw = gtk.ScrolledWindow()
+        hsw.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        hsw.set_shadow_type(gtk.SHADOW_IN)
+        self._hbuf = gtk.TextBuffer()
+        self._hview = gtk.TextView(self._hbuf)
+        self._hview.modify_font(pango.FontDescription('Monospace'))
+        hsw.add(self._hview)
+        self.notebook.append_page(hsw, tab_label=gtk.Label("Handlers"))
+
+        ssw = gtk.ScrolledWindow()
+        ssw.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        ssw.set_shadow_type(gtk.SHADOW_IN)
+        self._sbuf = gtk.TextBuffer()
+        self._sview = gtk.TextView(self._sbuf)
+        ssw.add(self._sview)
+        self.notebook.append_page(ssw, tab_label=gtk.Label("Stalls"))
         
         self.notebook.show_all()
 
@@ -146,6 +163,26 @@ class DebugWindow(gtk.Dialog):
         of = open(iofn, 'r')
         self._ibuf.set_text(of.read())
         of.close()
+        self.show_handler_stats()
+        self.show_stalls()
+
+    def show_stalls(self):
+        watchdog = self.application.watchdog
+        if watchdog is None:
+            self._sbuf.set_text('The watchdog is disabled, enable '
+                                'watchdog.enabled to record stalls.')
+        elif not watchdog.stalls:
+            self._sbuf.set_text('No stalls recorded.')
+        else:
+            self._sbuf.set_text(watchdog.report())
+
+    def show_handler_stats(self):
+        stats = self.application.handler_stats
+        if stats is None:
+            self._hbuf.set_text('Handler timing is disabled, enable '
+                                'events.instrument to record it.')
+        else:
+            self._hbuf.set_text(stats.report())
         
     def _print(self, line):
         self._buffer.insert_at_cursor(line + '\n')
@@ -228,6 +265,14 @@ def show_log():
     dw.run()
     dw.destroy()
 
+def show_handler_stats():
+    dw = DebugWindow()
+    dw.set_title('Event Handler Timings')
+    dw.show_handler_stats()
+    dw.notebook.set_current_page(3)
+    dw.run()
+    dw.destroy()
+
 if __name__ == '__main__':
     dw = DebugWindow()
     resp = dw.run()
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*- 
+# vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
+# $Id$
+#Copyright (c) 2005 Ali Afshar aafshar@gmail.com
+
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+
+#The above copyright notice and this permission notice shall be included in
+#all copies or substantial portions of the Software.
+
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""Diagnostic tools for finding out what is slowing Pida down."""
+
+# System imports
+import sys
+import time
+import thread
+import threading
+import traceback
+try:
+    import cProfile as profile
+except ImportError:
+    import profile
+
+# GTK imports
+import gobject
+
+# Upper bounds (in seconds) of the handler latency histogram buckets. The last
+# bucket counts everything slower than the last bound.
+HISTOGRAM_BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+class HandlerStats(object):
+    """
+    Call counts and latencies for the handlers of plugin signals.
+
+    Statistics are kept per (plugin name, signal type, signal name).
+    """
+    def __init__(self):
+        # key -> [calls, total time, max time, histogram]
+        self.stats = {}
+
+    def record(self, pluginname, sigtype, signame, duration):
+        """
+        Record a single handler call.
+
+        @param duration: The time the handler took in seconds.
+        @type duration: float
+        """
+        key = (pluginname, sigtype, signame)
+        stat = self.stats.get(key)
+        if stat is None:
+            stat = [0, 0.0, 0.0, [0] * (len(HISTOGRAM_BOUNDS) + 1)]
+            self.stats[key] = stat
+        stat[0] = stat[0] + 1
+        stat[1] = stat[1] + duration
+        if duration > stat[2]:
+            stat[2] = duration
+        for i, bound in enumerate(HISTOGRAM_BOUNDS):
+            if duration <= bound:
+                break
+        else:
+            i = len(HISTOGRAM_BOUNDS)
+        stat[3][i] = stat[3][i] + 1
+
+    def clear(self):
+        self.stats = {}
+
+    def iter_sorted(self):
+        """
+        Yield (key, calls, total, max, histogram), slowest total first.
+        """
+        items = [(stat[1], key, stat) for key, stat in self.stats.items()]
+        items.sort()
+        items.reverse()
+        for total, key, (calls, total, maxtime, hist) in items:
+            yield key, calls, total, maxtime, hist
+
+    def report(self):
+        """
+        Return a plain text report of the statistics.
+        """
+        heads = ['<=%gms' % (b * 1000) for b in HISTOGRAM_BOUNDS]
+        heads.append('>%gms' % (HISTOGRAM_BOUNDS[-1] * 1000))
+        lines = ['%-30s %7s %10s %10s %10s  %s' % ('handler', 'calls',
+                 'total ms', 'mean ms', 'max ms', ' '.join(heads))]
+        for key, calls, total, maxtime, hist in self.iter_sorted():
+            name = '%s.%s_%s' % key
+            lines.append('%-30s %7d %10.2f %10.2f %10.2f  %s' % (name, calls,
+                         total * 1000, total * 1000 / calls, maxtime * 1000,
+                         ' '.join(['%*d' % (len(h), n)
+                                   for h, n in zip(heads, hist)])))
+        return '\n'.join(lines)
+
+class PhaseTimer(object):
+    """
+    Times named phases, such as the phases of startup.
+    """
+    def __init__(self):
+        self.started = time.time()
+        # list of (name, duration)
+        self.phases = []
+
+    def call(self, name, func, *args, **kw):
+        """
+        Call a function, timing it as the named phase.
+        """
+        began = time.time()
+        try:
+            return func(*args, **kw)
+        finally:
+            self.phases.append((name, time.time() - began))
+
+    def profile(self, filename, func, *args, **kw):
+        """
+        Call a function in the profiler, and write the stats to a file.
+        """
+        profiler = profile.Profile()
+        try:
+            return profiler.runcall(func, *args, **kw)
+        finally:
+            profiler.dump_stats(filename)
+
+    def report(self):
+        """
+        Return a plain text report of the phases, slowest first.
+        """
+        total = time.time() - self.started
+        phases = [(duration, name) for name, duration in self.phases]
+        phases.sort()
+        phases.reverse()
+        lines = ['%-40s %10s %6s' % ('phase', 'ms', '%')]
+        for duration, name in phases:
+            lines.append('%-40s %10.1f %6.1f' % (name, duration * 1000,
+                         duration * 100 / total))
+        lines.append('%-40s %10.1f' % ('total', total * 1000))
+        return '\n'.join(lines)
+
+class NullTimer(PhaseTimer):
+    """
+    A phase timer which does not time anything.
+    """
+    def call(self, name, func, *args, **kw):
+        return func(*args, **kw)
+
+# The number of stall reports kept by the watchdog.
+MAX_STALLS = 50
+
+class Stall(object):
+    """
+    A period during which the main loop was blocked.
+    """
+    def __init__(self, began, duration, stack):
+        self.began = began
+        self.duration = duration
+        self.stack = stack
+
+    def report(self):
+        """
+        Return a plain text report of the stall and where it happened.
+        """
+        head = 'Main loop blocked for %.2fs at %s' % (self.duration,
+            time.strftime('%H:%M:%S', time.localtime(self.began)))
+        return '%s\n%s' % (head, ''.join(self.stack))
+
+class Watchdog(object):
+    """
+    A thread which notices when the GTK main loop stops responding.
+
+    The main loop updates a heartbeat on a timeout. If the watchdog thread
+    sees no heartbeat for longer than the threshold, it captures the stack
+    of the main thread. The stall is reported from the main loop, with its
+    full duration, once the main loop is running again.
+    """
+    def __init__(self, threshold, reportcb=None):
+        """
+        @param threshold: The time in seconds after which the main loop is
+            considered blocked.
+        @type threshold: float
+
+        @param reportcb: Called in the main loop with each L{Stall}.
+        @type reportcb: function
+        """
+        self.threshold = threshold
+        self.interval = max(threshold / 4, 0.05)
+        self.reportcb = reportcb
+        self.stalls = []
+        self.main_ident = thread.get_ident()
+        self.lock = threading.Lock()
+        self.last_beat = None
+        # (began, stack) of the stall in progress
+        self.current = None
+        self.running = False
+
+    def start(self):
+        """
+        Start the heartbeat and the watchdog thread.
+        """
+        self.running = True
+        gobject.timeout_add(int(self.interval * 1000), self.cb_beat)
+        watcher = threading.Thread(target=self.watch)
+        watcher.setDaemon(True)
+        watcher.start()
+
+    def stop(self):
+        self.running = False
+
+    def cb_beat(self):
+        now = time.time()
+        self.lock.acquire()
+        try:
+            self.last_beat = now
+            current = self.current
+            self.current = None
+        finally:
+            self.lock.release()
+        if current is not None:
+            began, stack = current
+            stall = Stall(began, now - began, stack)
+            self.stalls.append(stall)
+            del self.stalls[:-MAX_STALLS]
+            if self.reportcb:
+                self.reportcb(stall)
+        return self.running
+
+    def watch(self):
+        while self.running:
+            time.sleep(self.interval)
+            self.lock.acquire()
+            try:
+                # Nothing to watch before the main loop has started, and
+                # each stall is only captured once.
+                if self.last_beat is not None and self.current is None:
+                    if time.time() - self.last_beat > self.threshold:
+                        self.current = (self.last_beat, self.capture())
+            finally:
+                self.lock.release()
+
+    def capture(self):
+        """
+        Return the formatted stack of the main thread.
+        """
+        frame = sys._current_frames().get(self.main_ident)
+        if frame is None:
+            return []
+        return traceback.format_stack(frame)
+
+    def report(self):
+        """
+        Return a plain text report of the recent stalls.
+        """
+        return '\n'.join([stall.report() for stall in self.stalls])
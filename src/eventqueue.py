@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*- 
+# vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
+# $Id$
+#Copyright (c) 2005 Ali Afshar aafshar@gmail.com
+
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+
+#The above copyright notice and this permission notice shall be included in
+#all copies or substantial portions of the Software.
+
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+"""Deferring bursts of events, so only the latest of each is delivered."""
+
+# GTK imports
+import gobject
+
+class EventQueue(object):
+    """
+    A queue of deferred events, delivered together on the next GTK idle.
+
+    Events queued with the same name and key replace each other, keeping
+    only the latest arguments, and are delivered in the order they were
+    last queued.
+
+    An attached event belongs with the next event of another name, such as
+    the filetype sent before each bufferchange. It is delivered just before
+    that event, and is dropped with it when it is replaced.
+    """
+    def __init__(self, deliver, attached=None):
+        """
+        @param deliver: The function called with C{(name, args, kw)} for each
+            event as the queue is flushed.
+        @type deliver: function
+        @param attached: The names of attached events, mapped to the name of
+            the event each belongs with.
+        @type attached: C{dict}
+        """
+        self.deliver = deliver
+        self.attached = attached or {}
+        # (name, key) -> (serial, name, args, kw, attached events)
+        self.pending = {}
+        # (name, key) -> (serial, name, args, kw), of attached events not
+        # yet followed by their event
+        self.unclaimed = {}
+        self.serial = 0
+        self.idle_id = None
+
+    def push(self, name, key, args, kw):
+        """
+        Queue an event, replacing any queued event with the same key.
+        """
+        self.serial = self.serial + 1
+        event = (self.serial, name, args, kw)
+        if name in self.attached:
+            self.unclaimed[(name, key)] = event
+        else:
+            claimed = []
+            for ckey, cevent in self.unclaimed.items():
+                if self.attached[ckey[0]] == name:
+                    claimed.append(cevent)
+                    del self.unclaimed[ckey]
+            claimed.sort()
+            serial = self.serial
+            if claimed:
+                # Kept in the place of the first attached event
+                serial = claimed[0][0]
+            self.pending[(name, key)] = (serial, name, args, kw, claimed)
+        if self.idle_id is None:
+            self.idle_id = gobject.idle_add(self.cb_idle)
+
+    def has_pending(self):
+        return bool(self.pending or self.unclaimed)
+
+    def flush(self):
+        """
+        Deliver all the queued events now.
+        """
+        if self.idle_id is not None:
+            gobject.source_remove(self.idle_id)
+            self.idle_id = None
+        events = self.pending.values()
+        for serial, name, args, kw in self.unclaimed.values():
+            events.append((serial, name, args, kw, []))
+        events.sort()
+        self.pending = {}
+        self.unclaimed = {}
+        for serial, name, args, kw, claimed in events:
+            for cserial, cname, cargs, ckw in claimed:
+                self.deliver(cname, cargs, ckw)
+            self.deliver(name, args, kw)
+
+    def cb_idle(self):
+        self.idle_id = None
+        self.flush()
+        return False
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*- 
+# vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
+# $Id$
+#Copyright (c) 2005 Ali Afshar aafshar@gmail.com
+
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+
+#The above copyright notice and this permission notice shall be included in
+#all copies or substantial portions of the Software.
+
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+"""An index of the files of a project, for opening them by name."""
+
+# System imports
+import os
+import re
+import stat
+import bisect
+import cPickle as pickle
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+INDEX_VERSION = 1
+
+# The most candidates ranked for a query, from the text searched first
+MAX_CANDIDATES = 2000
+
+def get_index_filename(directory, root):
+    """
+    Return the file the index of a project root is kept in.
+
+    @param directory: The directory of indexes.
+    """
+    return os.path.join(directory, '%s.index' % md5(root).hexdigest())
+
+class FileIndex(object):
+    """
+    The files under a root directory, excluding those whose names match a
+    pattern.
+
+    Each directory is listed with its modification time, so updating only
+    lists directories that have changed since, and stats the rest.
+
+    @ivar paths: The paths of the files, relative to the root and sorted.
+    @type paths: C{list}
+    """
+
+    def __init__(self, root, filename, exclude=None):
+        """
+        @param filename: Where the index is saved.
+        @param exclude: The pattern of names to leave out, or None.
+        @type exclude: C{str}
+        """
+        self.root = root
+        self.filename = filename
+        self.exclude = exclude
+        if exclude:
+            self.exclude_re = re.compile(exclude)
+        else:
+            self.exclude_re = None
+        # relative directory -> (mtime, files, subdirectories)
+        self.dirs = {}
+        self.paths = []
+
+    def load(self):
+        """
+        Read the saved index, if it is for the same root and exclusions.
+        """
+        try:
+            f = open(self.filename, 'rb')
+            try:
+                data = pickle.load(f)
+            finally:
+                f.close()
+        except Exception:
+            # Missing or unreadable, it will be rebuilt
+            return False
+        if (not isinstance(data, dict) or
+            data.get('version') != INDEX_VERSION or
+            data.get('root') != self.root or
+            data.get('exclude') != self.exclude):
+            return False
+        dirs = self.dirs
+        self.dirs = data.get('dirs')
+        try:
+            self.paths = self.get_paths()
+        except Exception:
+            self.dirs = dirs
+            return False
+        return True
+
+    def save(self):
+        data = {'version': INDEX_VERSION,
+                'root': self.root,
+                'exclude': self.exclude,
+                'dirs': self.dirs}
+        tmpname = '%s.tmp' % self.filename
+        f = open(tmpname, 'wb')
+        try:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        os.rename(tmpname, self.filename)
+
+    def update(self):
+        """
+        Bring the index up to date with the disk.
+
+        @return: Whether anything changed.
+        """
+        changed = False
+        dirs = {}
+        pending = ['']
+        while pending:
+            reldir = pending.pop()
+            path = os.path.join(self.root, reldir)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            entry = self.dirs.get(reldir)
+            if entry is None or entry[0] != mtime:
+                entry = self.list_directory(reldir, mtime)
+                changed = True
+            dirs[reldir] = entry
+            pending.extend(entry[2])
+        if len(dirs) != len(self.dirs):
+            # Directories were removed
+            changed = True
+        self.dirs = dirs
+        if changed:
+            self.paths = self.get_paths()
+        return changed
+
+    def list_directory(self, reldir, mtime):
+        path = os.path.join(self.root, reldir)
+        files = []
+        subdirs = []
+        try:
+            names = os.listdir(path)
+        except OSError:
+            names = []
+        for name in names:
+            if self.exclude_re is not None and self.exclude_re.match(name):
+                continue
+            relpath = os.path.join(reldir, name)
+            try:
+                mode = os.lstat(os.path.join(path, name)).st_mode
+            except OSError:
+                continue
+            # Links to directories are not followed, they may loop
+            if stat.S_ISDIR(mode):
+                subdirs.append(relpath)
+            else:
+                files.append(relpath)
+        return mtime, files, subdirs
+
+    def get_paths(self):
+        paths = []
+        for mtime, files, subdirs in self.dirs.itervalues():
+            paths.extend(files)
+        paths.sort()
+        return paths
+
+class FuzzyMatcher(object):
+    """
+    Match queries against paths, by the characters of the query appearing
+    in order.
+
+    The paths are joined into one text for each of the names and the whole
+    paths, so that the regular expression engine does the scanning.
+    Matches in the name rank before matches in the directory, then shorter
+    paths before longer ones.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.lower_paths = [p.lower() for p in paths]
+        names = [os.path.basename(p) for p in self.lower_paths]
+        self.names_text, self.names_starts = self.join(names)
+        self.paths_text, self.paths_starts = self.join(self.lower_paths)
+        # The last query, and all the lines it matched or None if too many
+        self.last_query = None
+        self.last_found = None
+
+    def join(self, lines):
+        """
+        Return the lines joined, with the offset each starts at.
+        """
+        starts = []
+        offset = 0
+        for line in lines:
+            starts.append(offset)
+            offset = offset + len(line) + 1
+        return '\n'.join(lines), starts
+
+    def get_pattern(self, query):
+        """
+        Return the pattern of the characters of a query in order, on one
+        line. Each gap excludes the character after it, so nothing is tried
+        twice.
+        """
+        parts = [re.escape(query[0])]
+        for c in query[1:]:
+            parts.append('[^\n%s]*%s' % (re.escape(c), re.escape(c)))
+        return re.compile(''.join(parts))
+
+    def search(self, text, starts, rx, found, limit):
+        """
+        Add to found the indexes of the lines rx matches, up to limit.
+
+        @return: Whether the limit was reached.
+        """
+        pos = 0
+        while len(found) < limit:
+            m = rx.search(text, pos)
+            if m is None:
+                return False
+            i = bisect.bisect_right(starts, m.start()) - 1
+            found[i] = True
+            # On to the next line
+            pos = text.find('\n', m.end())
+            if pos < 0:
+                return False
+            pos = pos + 1
+        return True
+
+    def find(self, query, rx, count):
+        """
+        Return the indexes of the lines to rank for a query.
+
+        A query extending the last one, which matched few enough lines to
+        keep them all, only searches those lines.
+        """
+        if (self.last_found is not None and
+            query.startswith(self.last_query)):
+            found = [i for i in self.last_found
+                     if rx.search(self.lower_paths[i])]
+            self.last_query = query
+            self.last_found = found
+            return found
+        found = {}
+        capped = self.search(self.names_text, self.names_starts, rx, found,
+                             MAX_CANDIDATES)
+        # Matches in the directories rank last, so are only needed to fill
+        if not capped:
+            if len(found) < count:
+                capped = self.search(self.paths_text, self.paths_starts, rx,
+                                     found, len(found) + MAX_CANDIDATES)
+            else:
+                capped = True
+        found = found.keys()
+        self.last_query = query
+        if capped:
+            self.last_found = None
+        else:
+            self.last_found = found
+        return found
+
+    def match(self, query, count=50):
+        """
+        Return the best matching paths for a query.
+
+        @param count: The most paths returned.
+        """
+        if not query:
+            return self.paths[:count]
+        query = query.lower()
+        rx = self.get_pattern(query)
+        ranked = []
+        for i in self.find(query, rx, count):
+            path = self.lower_paths[i]
+            name = os.path.basename(path)
+            if query in name:
+                rank = 0
+            elif rx.search(name):
+                rank = 1
+            else:
+                rank = 2
+            ranked.append((rank, len(path), self.paths[i]))
+        ranked.sort()
+        return [r[2] for r in ranked[:count]]
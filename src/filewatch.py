@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*- 
+# vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
+# $Id$
+#Copyright (c) 2005 Ali Afshar aafshar@gmail.com
+
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+
+#The above copyright notice and this permission notice shall be included in
+#all copies or substantial portions of the Software.
+
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+"""Watching files edited outside Pida, so that changes are applied live."""
+
+# System imports
+import os
+import logging
+
+# GTK imports
+import gobject
+
+def get_stamp(filename):
+    """
+    Return what is compared to tell whether a file has changed.
+
+    @return: The modification time, size and inode, or None if the file is
+        missing.
+    """
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size, st.st_ino
+
+class FileWatcher(object):
+    """
+    Poll the stat data of files on a timeout, calling back when they change.
+
+    Polling a handful of stat calls is cheap, and works wherever the files
+    are, unlike kernel notification.
+    """
+
+    def __init__(self):
+        # filename -> [stamp, callbacks]
+        self.watched = {}
+        self.timeout_id = None
+
+    def watch(self, filename, callback):
+        """
+        Call callback with the filename whenever the file changes.
+        """
+        if not filename in self.watched:
+            self.watched[filename] = [get_stamp(filename), []]
+        callbacks = self.watched[filename][1]
+        if not callback in callbacks:
+            callbacks.append(callback)
+
+    def unwatch(self, filename, callback):
+        if filename in self.watched:
+            callbacks = self.watched[filename][1]
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                del self.watched[filename]
+
+    def start(self, interval):
+        """
+        Start polling.
+
+        @param interval: The time between polls in milliseconds.
+        @type interval: int
+        """
+        if self.timeout_id is None:
+            self.timeout_id = gobject.timeout_add(interval, self.cb_poll)
+
+    def stop(self):
+        if self.timeout_id is not None:
+            gobject.source_remove(self.timeout_id)
+            self.timeout_id = None
+
+    def cb_poll(self):
+        for filename, entry in self.watched.items():
+            stamp = get_stamp(filename)
+            if stamp == entry[0]:
+                continue
+            entry[0] = stamp
+            for callback in list(entry[1]):
+                try:
+                    callback(filename)
+                except Exception:
+                    # One bad reload must not stop the watching
+                    logging.getLogger().exception('Reloading %s failed',
+                                                  filename)
+        return True
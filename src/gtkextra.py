@@ -22,13 +22,19 @@
 #SOFTWARE.
 
 import gtk
-import shelve
 import fnmatch
 import gobject
 import base
+import iconatlas
 
 POPUP_CONTEXTS = ['file', 'dir', 'terminal', 'position', 'string', 'url']
 
+# The number of decoded icon pixbufs kept
+ICON_CACHE_SIZE = 128
+
+# The sort column id of a tree model which is not sorted
+UNSORTED_SORT_COLUMN_ID = -2
+
 class Tree(base.pidaobject):
     """
     A custom treeview subclass that is used throughout Pida.
@@ -39,16 +45,47 @@ class Tree(base.pidaobject):
 
     @cvar SCROLLABLE: Whether the tree will be placed in a scrolled window.
     @type SCROLLABLE: C{boolean}
+
+    @cvar VIRTUAL: Whether the tree is a flat list of records, whose values
+        are only computed for the rows rendered, see L{set_rows}.
+    @type VIRTUAL: C{boolean}
+
+    @cvar KEY_COLUMN: The column identifying rows, for L{update_items}.
+    @type KEY_COLUMN: C{int}
+
+    @cvar FILTER_COLUMN: The text column searched by the filter bar, or None
+        for no filter bar. Only for lists, the rows are not nested.
+    @type FILTER_COLUMN: C{int}
     """
     COLUMNS = [('name', gobject.TYPE_STRING, gtk.CellRendererText, True,
                 'markup')]
     SCROLLABLE = True
+    VIRTUAL = False
+    KEY_COLUMN = None
+    FILTER_COLUMN = None
     XPAD = 0
     YPAD = 1
 
     def do_init(self, *args):
-        self.model = gtk.TreeStore(*[l[1] for l in self.COLUMNS])
-        self.view = gtk.TreeView(self.model)
+        if self.VIRTUAL:
+            # The records, and how they are sorted and filtered
+            self.rows = []
+            self.row_key = None
+            self.row_reverse = False
+            self.row_filter = None
+            self.model = self.make_virtual_model()
+        else:
+            self.model = gtk.TreeStore(*[l[1] for l in self.COLUMNS])
+        # The texts matching the filter bar, None when it is empty
+        self.filter_index = TypeAheadIndex()
+        self.filter_matches = None
+        self.filter_model = None
+        if self.FILTER_COLUMN is not None and not self.VIRTUAL:
+            self.filter_model = self.model.filter_new()
+            self.filter_model.set_visible_func(self.cb_filter_visible)
+            for signal in ['row-inserted', 'row-changed', 'row-deleted']:
+                self.model.connect(signal, self.cb_filter_stale)
+        self.view = gtk.TreeView(self.get_view_model())
         self.view.set_headers_visible(False)
         self.view.set_rules_hint(True)
         self.view.set_enable_search(False)
@@ -57,6 +94,14 @@ class Tree(base.pidaobject):
         self.toolbar = gtk.HBox()
         self.win.pack_start(self.toolbar, expand=False, padding=4)
 
+        if self.FILTER_COLUMN is not None:
+            self.filter_entry = gtk.Entry()
+            self.win.pack_start(self.filter_entry, expand=False)
+            self.filter_entry.connect('changed', self.cb_filter_changed)
+            self.filter_entry.connect('key-press-event', self.cb_filter_key)
+            # Typing in the list goes to the filter bar
+            self.view.connect('key-press-event', self.cb_view_key)
+
         if self.SCROLLABLE:
             sw = gtk.ScrolledWindow()
             self.win.pack_start(sw)
@@ -73,9 +118,16 @@ class Tree(base.pidaobject):
                 attrdict = {attr:i}
                 column = gtk.TreeViewColumn(name, renderer, **attrdict)
                 #column.set_expand(False)
-                column.set_sizing(gtk.TREE_VIEW_COLUMN_AUTOSIZE)
+                if self.VIRTUAL:
+                    # Autosizing would compute the values of every row
+                    column.set_sizing(gtk.TREE_VIEW_COLUMN_FIXED)
+                    column.set_expand(True)
+                else:
+                    column.set_sizing(gtk.TREE_VIEW_COLUMN_AUTOSIZE)
                 self.view.append_column(column)
             i = i + 1
+        if self.VIRTUAL:
+            self.view.set_fixed_height_mode(True)
 
         self.r_cb_activated = None
         self.view.connect('row-activated', self.cb_activated)
@@ -87,6 +139,11 @@ class Tree(base.pidaobject):
 
 
         self.view.columns_autosize()
+        # Nesting depth of freeze(), and the sorting to restore on thaw()
+        self.frozen = 0
+        self.frozen_sort = None
+        # key -> gtk.TreeRowReference, of the rows added by update_items
+        self.row_refs = {}
         self.init()
     
     def init(self):
@@ -97,9 +154,330 @@ class Tree(base.pidaobject):
         """ Add an item to the tree view's model. """
         return self.model.append(parent, data)
 
+    def add_items(self, rows, parent=None):
+        """
+        Add many items to the tree view's model at once.
+
+        The model is detached from the view while they are added, see
+        L{freeze}.
+
+        @param rows: The data of each item.
+        @type rows: C{list}
+        """
+        self.freeze()
+        try:
+            append = self.model.append
+            for data in rows:
+                append(parent, data)
+        finally:
+            self.thaw()
+
+    def freeze(self):
+        """
+        Detach the model from the view, and stop autosizing and sorting,
+        until L{thaw}. Adding items is then not seen by the view, which is
+        only updated once on thaw. Calls may be nested.
+        """
+        self.frozen = self.frozen + 1
+        if self.frozen > 1:
+            return
+        if self.VIRTUAL:
+            self.view.set_model(None)
+            return
+        # The filter model would be refiltered on every change
+        self.view.set_model(None)
+        self.filter_model = None
+        self.frozen_sort = self.model.get_sort_column_id()
+        if self.frozen_sort[0] is not None:
+            self.model.set_sort_column_id(UNSORTED_SORT_COLUMN_ID,
+                                          gtk.SORT_ASCENDING)
+        for column in self.view.get_columns():
+            column.set_sizing(gtk.TREE_VIEW_COLUMN_GROW_ONLY)
+
+    def thaw(self):
+        """
+        Reattach the model to the view, after L{freeze}.
+        """
+        self.frozen = self.frozen - 1
+        if self.frozen > 0:
+            return
+        if self.VIRTUAL:
+            self.view.set_model(self.model)
+            return
+        if self.FILTER_COLUMN is not None:
+            self.filter_model = self.model.filter_new()
+            self.filter_model.set_visible_func(self.cb_filter_visible)
+        if self.frozen_sort[0] is not None:
+            self.model.set_sort_column_id(*self.frozen_sort)
+        self.frozen_sort = None
+        self.view.set_model(self.get_view_model())
+        for column in self.view.get_columns():
+            column.set_sizing(gtk.TREE_VIEW_COLUMN_AUTOSIZE)
+
     def clear(self):
         """ Clear the View. """
-        self.model.clear()
+        if self.VIRTUAL:
+            self.set_rows([])
+        else:
+            self.model.clear()
+        self.row_refs = {}
+
+    def get_row_key(self, row):
+        """
+        Return the key identifying a row, for overriding.
+
+        @param row: The row data, or a row of the model.
+        """
+        return row[self.KEY_COLUMN]
+
+    def update_items(self, rows, parent=None, parentkey=None):
+        """
+        Make the rows under parent those given, in the same order.
+
+        Rows are matched by key, so only the rows which are new, gone, moved
+        or changed are touched, and the selection and expanded rows are
+        kept.
+
+        @param rows: The data of each row.
+        @param parent: The iter of the parent row, or None for the top level.
+        @param parentkey: The key of the parent row, which the keys of the
+            rows are made under.
+
+        @return: The iter and key of each row.
+        @rtype: C{list}
+        """
+        keys = self.make_keys(rows, parentkey)
+        wanted = dict.fromkeys(keys)
+        model = self.model
+        # Filling an empty tree is faster without the view
+        frozen = parent is None and model.iter_n_children(None) == 0
+        if frozen:
+            self.freeze()
+        try:
+            # Remove the rows which are gone, keeping the order of the rest
+            niter = model.iter_children(parent)
+            existing = []
+            while niter is not None:
+                existing.append(model[niter])
+                niter = model.iter_next(niter)
+            current = []
+            kept = {}
+            for key, row in zip(self.make_keys(existing, parentkey),
+                                existing):
+                if key in wanted:
+                    current.append(key)
+                    kept[key] = row.iter
+                else:
+                    model.remove(row.iter)
+                    self.row_refs.pop(key, None)
+            # Add, move and update the rest, in one pass along the rows kept.
+            # The iters of a tree store stay valid as rows are added.
+            items = []
+            pos = 0
+            for key, row in zip(keys, rows):
+                target = None
+                if pos < len(current):
+                    target = kept[current[pos]]
+                if pos < len(current) and current[pos] == key:
+                    niter = target
+                    pos = pos + 1
+                    self.update_row(niter, row)
+                elif key in kept:
+                    niter = kept[key]
+                    model.move_before(niter, target)
+                    current.remove(key)
+                    self.update_row(niter, row)
+                else:
+                    niter = model.insert_before(parent, target, row)
+                    self.row_refs[key] = gtk.TreeRowReference(model,
+                                                    model.get_path(niter))
+                items.append((niter, key))
+        finally:
+            if frozen:
+                self.thaw()
+        return items
+
+    def make_keys(self, rows, parentkey):
+        # Rows with the same key are told apart by how many came before
+        keys = []
+        seen = {}
+        for row in rows:
+            key = self.get_row_key(row)
+            if parentkey is not None:
+                key = (parentkey, key)
+            count = seen.get(key, 0)
+            seen[key] = count + 1
+            if count:
+                key = (key, count)
+            keys.append(key)
+        return keys
+
+    def update_row(self, niter, row):
+        """ Set the values of a row which have changed. """
+        for column, value in enumerate(row):
+            if self.model.get_value(niter, column) != value:
+                self.model.set_value(niter, column, value)
+
+    def get_iter_by_key(self, key):
+        """ Return the iter of the row with the key, or None. """
+        ref = self.row_refs.get(key)
+        if ref is None:
+            return None
+        if not ref.valid():
+            del self.row_refs[key]
+            return None
+        return self.model.get_iter(ref.get_path())
+
+    def set_active_key(self, key):
+        """
+        Select the row with the key.
+
+        @return: Whether there is such a row.
+        """
+        niter = self.get_iter_by_key(key)
+        if niter is None:
+            return False
+        path = self.model.get_path(niter)
+        if self.filter_model is not None:
+            path = self.filter_model.convert_child_path_to_path(path)
+            if path is None:
+                # Filtered out
+                return False
+        self.view.set_cursor(path)
+        return True
+
+    def get_view_model(self):
+        """ Return the model the view shows, which may be filtered. """
+        if self.filter_model is not None:
+            return self.filter_model
+        return self.model
+
+    def set_filter(self, text):
+        """
+        Only show the rows whose filter column contains text, ignoring case.
+        """
+        if self.filter_index.stale:
+            if self.VIRTUAL:
+                texts = [self.get_virtual_value(r, self.FILTER_COLUMN)
+                         for r in self.rows]
+            else:
+                texts = [r[self.FILTER_COLUMN] for r in self.model]
+            self.filter_index.set_texts(texts)
+        self.filter_matches = self.filter_index.search(text)
+        if self.VIRTUAL:
+            self.update_virtual_model()
+        elif self.filter_model is not None:
+            self.filter_model.refilter()
+
+    def is_filtered_out(self, text):
+        matches = self.filter_matches
+        if matches is None:
+            return False
+        text = ('%s' % text).lower()
+        if text in self.filter_index.texts:
+            return not text in matches
+        # Added since the index was made
+        return not self.filter_index.query in text
+
+    def cb_filter_visible(self, model, niter):
+        return not self.is_filtered_out(model.get_value(niter,
+                                                        self.FILTER_COLUMN))
+
+    def cb_filter_stale(self, *args):
+        self.filter_index.stale = True
+
+    def cb_filter_changed(self, entry):
+        self.set_filter(entry.get_text())
+
+    def cb_filter_key(self, entry, event):
+        if event.keyval == gtk.keysyms.Escape:
+            entry.set_text('')
+            self.view.grab_focus()
+            return True
+        return False
+
+    def cb_view_key(self, view, event):
+        if (event.string and event.string.isalnum() and
+            not event.state & gtk.gdk.CONTROL_MASK):
+            self.filter_entry.grab_focus()
+            self.filter_entry.set_text(self.filter_entry.get_text() +
+                                       event.string)
+            self.filter_entry.set_position(-1)
+            return True
+        return False
+
+    def set_rows(self, rows):
+        """
+        Set the records of a virtual tree.
+
+        @param rows: The records, any sequence supporting C{len} and
+            indexing, so they may also be computed on demand.
+        """
+        self.rows = rows
+        self.filter_index.stale = True
+        if self.filter_matches is not None:
+            self.set_filter(self.filter_index.query)
+        else:
+            self.update_virtual_model()
+
+    def sort_rows(self, key, reverse=False):
+        """
+        Sort the records of a virtual tree.
+
+        @param key: A function of a record returning its sort key, or None
+            for the order given.
+        """
+        self.row_key = key
+        self.row_reverse = reverse
+        self.update_virtual_model()
+
+    def filter_rows(self, predicate):
+        """
+        Only show the records of a virtual tree for which predicate is true,
+        or all of them if it is None.
+        """
+        self.row_filter = predicate
+        self.update_virtual_model()
+
+    def make_virtual_model(self, key=None, reverse=False, predicate=None):
+        """
+        Make a model of the records of a virtual tree, sorted and filtered.
+        """
+        if key is None:
+            key = self.row_key
+            reverse = self.row_reverse
+        if predicate is None:
+            predicate = self.row_filter
+        rows = self.rows
+        order = range(len(rows))
+        if predicate is not None:
+            order = [i for i in order if predicate(rows[i])]
+        if self.filter_matches is not None:
+            col = self.FILTER_COLUMN
+            order = [i for i in order if not self.is_filtered_out(
+                self.get_virtual_value(rows[i], col))]
+        if key is not None:
+            order.sort(key=lambda i: key(rows[i]), reverse=reverse)
+        return VirtualListModel([l[1] for l in self.COLUMNS],
+                                self.get_virtual_value, rows, order)
+
+    def update_virtual_model(self):
+        # The models do not change, so a new one is made and swapped in
+        self.model = self.make_virtual_model()
+        if not self.frozen:
+            self.view.set_model(self.model)
+
+    def get_virtual_value(self, record, column):
+        """
+        Return a value of a record in a virtual tree, for overriding.
+
+        It is only called for rows which are rendered.
+        """
+        return record[column]
+
+    def get_record(self, niter):
+        """ Return the record of a row in a virtual tree. """
+        return self.model.get_record(niter)
 
     def connect_select(self, cb):
         """ Connect the external single-click handler. """
@@ -145,7 +523,9 @@ class Tree(base.pidaobject):
         return True
 
     def update(self):
-        self.view.set_model(self.model)
+        # The view is given the model on thaw when frozen
+        if not self.frozen:
+            self.view.set_model(self.get_view_model())
 
     def selected(self, column):
         ite = self.selected_iter()
@@ -155,6 +535,9 @@ class Tree(base.pidaobject):
     def selected_iter(self):
         path = self.view.get_cursor()[0]
         if path:
+            if self.filter_model is not None:
+                niter = self.filter_model.get_iter(path)
+                return self.filter_model.convert_iter_to_child_iter(niter)
             return self.model.get_iter(path)
         
     def selected_path(self):
@@ -174,6 +557,129 @@ class Tree(base.pidaobject):
             else:
                 self.view.expand_row(path, False)
 
+class TypeAheadIndex(object):
+    """
+    An index of texts for finding those containing a query, ignoring case.
+
+    A query containing the previous one only searches the previous results,
+    so typing more stays fast on long lists.
+    """
+
+    def __init__(self):
+        self.texts = {}
+        # character -> the texts containing it
+        self.by_char = {}
+        self.query = ''
+        self.results = None
+        self.stale = True
+
+    def set_texts(self, texts):
+        self.texts = {}
+        self.by_char = {}
+        for text in texts:
+            text = ('%s' % text).lower()
+            if text in self.texts:
+                continue
+            self.texts[text] = True
+            for char in dict.fromkeys(text):
+                self.by_char.setdefault(char, []).append(text)
+        self.results = None
+        self.stale = False
+
+    def search(self, query):
+        """
+        @return: The texts containing the query, or None for all of them.
+        @rtype: C{dict}
+        """
+        query = query.lower()
+        if not query:
+            candidates = None
+        elif self.results is not None and self.query in query:
+            candidates = self.results
+        else:
+            # Only the texts with the least common character of the query
+            candidates = self.texts
+            for char in query:
+                texts = self.by_char.get(char, [])
+                if len(texts) < len(candidates):
+                    candidates = texts
+        self.query = query
+        if candidates is None:
+            self.results = None
+        else:
+            self.results = {}
+            for text in candidates:
+                if query in text:
+                    self.results[text] = True
+        return self.results
+
+class VirtualListModel(gtk.GenericTreeModel):
+    """
+    A list model over a sequence of records, which computes the values of a
+    row only when they are asked for, that is when the row is rendered.
+
+    A model is not changed once made, sorting or filtering the records
+    makes a new model.
+    """
+
+    def __init__(self, types, getvalue, rows, order):
+        """
+        @param types: The column types.
+        @param getvalue: Called with a record and column to get a value.
+        @param rows: The records.
+        @param order: The indexes of the records shown, in order.
+        """
+        gtk.GenericTreeModel.__init__(self)
+        self.types = types
+        self.getvalue = getvalue
+        self.rows = rows
+        self.order = order
+
+    def get_record(self, niter):
+        return self.rows[self.order[self.get_user_data(niter)]]
+
+    def on_get_flags(self):
+        return gtk.TREE_MODEL_LIST_ONLY | gtk.TREE_MODEL_ITERS_PERSIST
+
+    def on_get_n_columns(self):
+        return len(self.types)
+
+    def on_get_column_type(self, n):
+        return self.types[n]
+
+    def on_get_iter(self, path):
+        if path[0] < len(self.order):
+            return path[0]
+
+    def on_get_path(self, rowref):
+        return (rowref,)
+
+    def on_get_value(self, rowref, column):
+        return self.getvalue(self.rows[self.order[rowref]], column)
+
+    def on_iter_next(self, rowref):
+        if rowref + 1 < len(self.order):
+            return rowref + 1
+
+    def on_iter_children(self, rowref):
+        if rowref is None and self.order:
+            return 0
+
+    def on_iter_has_child(self, rowref):
+        return False
+
+    def on_iter_n_children(self, rowref):
+        if rowref is None:
+            return len(self.order)
+        return 0
+
+    def on_iter_nth_child(self, rowref, n):
+        if rowref is None and n < len(self.order):
+            return n
+
+    def on_iter_parent(self, child):
+        return None
+
 class FolderDialog(base.pidaobject, gtk.FileChooserDialog):
     TITLE = 'Select Directory'
     ACTION = gtk.FILE_CHOOSER_ACTION_SELECT_FOLDER
@@ -557,19 +1063,65 @@ class ContextToolbar(ContextGenerator, Toolbar):
             self.win.remove(i)
 
 class Icons(base.pidaobject):
+    """
+    The icons, decoded into pixbufs which are cached and shared.
+
+    The pixbufs returned are shared between all callers, and must not be
+    modified.
+    """
 
     def do_init(self):
         icon_file = self.prop_main_registry.files.icon_data.value()
-        self.d = shelve.open(icon_file, 'r')
+        # An icons shelve is converted to an atlas in the user directory
+        self.d = iconatlas.open_icons(icon_file,
+            self.prop_main_registry.directories.user.value())
         self.cs = gtk.gdk.COLORSPACE_RGB
+        # (name, size) -> [last use, pixbuf]
+        self.cache = {}
+        self.ticks = 0
+        self.hits = 0
+        self.misses = 0
     
-    def get(self, name, *args):
+    def get(self, name, size=None):
+        """
+        Return the shared pixbuf for the named icon.
+
+        @param size: The width and height to scale to, or None for the
+            size stored.
+        """
+        self.ticks = self.ticks + 1
+        key = (name, size)
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.hits = self.hits + 1
+            entry[0] = self.ticks
+            return entry[1]
+        self.misses = self.misses + 1
+        pb = self.decode(name, size)
+        if len(self.cache) >= ICON_CACHE_SIZE:
+            self.evict()
+        self.cache[key] = [self.ticks, pb]
+        return pb
+
+    def decode(self, name, size):
         if name not in  self.d:
             name = 'new'
         d, a = self.d[name]
         pb = gtk.gdk.pixbuf_new_from_data(d, self.cs, *a)
+        if size is not None:
+            pb = pb.scale_simple(size, size, gtk.gdk.INTERP_BILINEAR)
         return pb
 
+    def evict(self):
+        """
+        Drop the least recently used pixbuf.
+        """
+        oldest = None
+        for key, entry in self.cache.iteritems():
+            if oldest is None or entry[0] < oldest[0]:
+                oldest = (entry[0], key)
+        del self.cache[oldest[1]]
+
     def get_image(self, name, *size):
         im = gtk.Image()
         im.set_from_pixbuf(self.get(name))
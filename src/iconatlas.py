@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*- 
+# vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
+# $Id$
+#Copyright (c) 2005 Ali Afshar aafshar@gmail.com
+
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+
+#The above copyright notice and this permission notice shall be included in
+#all copies or substantial portions of the Software.
+
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+"""
+The icon atlas, a file holding all the icons which is read with mmap.
+
+The file is a header, an index of the icons by name, and the pixel data of
+all the icons, one after another. The header is the magic string, the format
+version and the number of icons. Each index entry is the length of the name,
+the name, the pixbuf arguments (has alpha, bits per sample, width, height,
+rowstride) and the offset and length of the pixel data in the file. All
+numbers are little-endian.
+"""
+
+# System imports
+import os
+import mmap
+import logging
+import shelve
+import struct
+
+MAGIC = 'PIDAICON'
+VERSION = 1
+
+HEADER = '<8sII'
+HEADER_SIZE = struct.calcsize(HEADER)
+NAME_LENGTH = '<H'
+NAME_LENGTH_SIZE = struct.calcsize(NAME_LENGTH)
+ENTRY = '<BBHHIII'
+ENTRY_SIZE = struct.calcsize(ENTRY)
+
+class BadAtlas(Exception):
+    pass
+
+class IconAtlas(object):
+    """
+    A read only mapping of icon name to C{(pixel data, pixbuf arguments)},
+    like the old icons shelve.
+    """
+
+    def __init__(self, filename):
+        f = open(filename, 'rb')
+        try:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (mmap.error, ValueError), e:
+                raise BadAtlas, '%s: %s' % (filename, e)
+        finally:
+            f.close()
+        self.index = {}
+        try:
+            self.read_index()
+        except struct.error, e:
+            self.close()
+            raise BadAtlas, '%s: %s' % (filename, e)
+
+    def read_index(self):
+        magic, version, count = struct.unpack(HEADER, self.map[:HEADER_SIZE])
+        if magic != MAGIC or version != VERSION:
+            raise BadAtlas, 'not an icon atlas version %s' % VERSION
+        pos = HEADER_SIZE
+        for i in xrange(count):
+            namelen, = struct.unpack(NAME_LENGTH,
+                                     self.map[pos:pos + NAME_LENGTH_SIZE])
+            pos = pos + NAME_LENGTH_SIZE
+            name = self.map[pos:pos + namelen]
+            pos = pos + namelen
+            ha, bp, w, h, rs, offset, length = struct.unpack(ENTRY,
+                self.map[pos:pos + ENTRY_SIZE])
+            pos = pos + ENTRY_SIZE
+            self.index[name] = offset, length, (bool(ha), bp, w, h, rs)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __getitem__(self, name):
+        offset, length, args = self.index[name]
+        return self.map[offset:offset + length], args
+
+    def keys(self):
+        return self.index.keys()
+
+    def close(self):
+        self.map.close()
+
+def write_atlas(filename, icons):
+    """
+    Write an icon atlas.
+
+    @param icons: The icons, as C{(name, pixel data, pixbuf arguments)}.
+    @type icons: C{list}
+    """
+    icons = list(icons)
+    icons.sort()
+    offset = HEADER_SIZE
+    for name, data, args in icons:
+        offset = offset + NAME_LENGTH_SIZE + len(name) + ENTRY_SIZE
+    index = [struct.pack(HEADER, MAGIC, VERSION, len(icons))]
+    for name, data, args in icons:
+        ha, bp, w, h, rs = args
+        index.append(struct.pack(NAME_LENGTH, len(name)))
+        index.append(name)
+        index.append(struct.pack(ENTRY, int(ha), bp, w, h, rs, offset,
+                                 len(data)))
+        offset = offset + len(data)
+    f = open(filename, 'wb')
+    f.write(''.join(index))
+    for name, data, args in icons:
+        f.write(data)
+    f.close()
+
+def is_atlas(filename):
+    try:
+        f = open(filename, 'rb')
+        try:
+            return f.read(len(MAGIC)) == MAGIC
+        finally:
+            f.close()
+    except IOError:
+        return False
+
+def get_atlas_filename(filename):
+    return '%s.atlas' % os.path.splitext(filename)[0]
+
+def convert_shelve(filename, atlasname):
+    """
+    Write the icons of an icons shelve as an atlas.
+    """
+    d = shelve.open(filename, 'r')
+    try:
+        icons = [(name, d[name][0], d[name][1]) for name in d.keys()]
+    finally:
+        d.close()
+    tmpname = '%s.tmp' % atlasname
+    write_atlas(tmpname, icons)
+    os.rename(tmpname, atlasname)
+
+def is_newer(filename, other):
+    """ Whether filename was modified after other, or other is missing. """
+    try:
+        mtime = os.stat(filename).st_mtime
+    except OSError:
+        return False
+    try:
+        return mtime > os.stat(other).st_mtime
+    except OSError:
+        return True
+
+def open_icons(filename, cachedir=None):
+    """
+    Open the icons file, or the atlas beside it if there is one.
+
+    Old icon files are shelves. When there is no atlas beside one, it is
+    converted to an atlas in cachedir, and only read if that fails.
+
+    @param cachedir: Where an atlas converted from a shelve is kept, or None
+        not to convert.
+    """
+    for atlasname in [filename, get_atlas_filename(filename)]:
+        if is_atlas(atlasname):
+            try:
+                return IconAtlas(atlasname)
+            except BadAtlas:
+                pass
+    if cachedir is not None:
+        atlasname = os.path.join(cachedir, 'icons.atlas')
+        try:
+            if is_newer(filename, atlasname) or not is_atlas(atlasname):
+                convert_shelve(filename, atlasname)
+            return IconAtlas(atlasname)
+        except Exception, e:
+            # Any failure leaves the shelve in use
+            logging.warn('Unable to convert icons to an atlas: %s' % e)
+    return shelve.open(filename, 'r')
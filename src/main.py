@@ -24,6 +24,7 @@
 # System imports
 import os
 import sys
+import time
 import logging
 import optparse
 
@@ -36,6 +37,10 @@ import base
 import mainwindow
 import gtkextra
 import firstrun
+import diagnostics
+import filewatch
+import eventqueue
+import manifest
 import configuration.options as options
 import configuration.config as config
 import configuration.registry as registry
@@ -47,15 +52,36 @@ __version__ = pida.__init__.__version__
 OPTPLUGINS = ['project', 'python_browser', 'python_debugger', 'python_profiler',
 'gazpacho', 'pastebin']
 
+# Events which may be deferred until idle, and coalesced. Each maps to a
+# function of the event arguments returning the key to coalesce on, so that
+# only the latest event for each key is delivered.
+COALESCABLE_EVENTS = {'bufferchange': lambda *args, **kw: None,
+                      'bufferlist': lambda *args, **kw: None,
+                      'filetype': lambda buffernumber, *args, **kw:
+                                    buffernumber}
+
+# Coalescable events which belong with the next event of another name, and
+# are dropped with it. The boss pairs each filetype with the bufferchange
+# after it, and a bufferchange for another buffer must not inherit it.
+ATTACHED_EVENTS = {'filetype': 'bufferchange'}
+
+# Events whose latest arguments are replayed, in this order, to optional
+# plugins loaded after they were dispatched.
+REPLAYED_EVENTS = ['populate', 'shown', 'started', 'reset', 'serverchange',
+                   'bufferlist', 'filetype', 'bufferchange']
+
 # Convenience method to ease importing plugin modules by name.
-def create_plugin(name, cb):
+def create_plugin(name, cb, timer=None):
     """ Find a named plugin and instantiate it. """
+    if timer is None:
+        timer = diagnostics.NullTimer()
     # import the module
     # The last arg [True] just needs to be non-empty
     try:
-        mod = __import__('pida.plugins.%s.plugin' % name, {}, {}, [True])
+        mod = timer.call('import %s' % name, __import__,
+                         'pida.plugins.%s.plugin' % name, {}, {}, [True])
         try:
-            inst = mod.Plugin()
+            inst = timer.call('instantiate %s' % name, mod.Plugin)
         except Exception, e:
             logging.warn('Plugin "%s" failed to instantiate: %s' % (name, e))
             inst = None
@@ -66,6 +92,57 @@ def create_plugin(name, cb):
     return inst
 
 
+class HandlerIndex(object):
+    """
+    An index of the plugin methods which handle each signal.
+
+    The index is built once as each plugin is loaded, by looking for methods
+    named C{<sigtype>_<signame>}, so signalling does not need to look up
+    attributes on every plugin.
+    """
+    def __init__(self):
+        # (sigtype, signame) -> list of (plugin, bound method)
+        self.handlers = {}
+
+    def add_plugin(self, plugin, sigtypes):
+        """
+        Index the handlers of the given signal types for a plugin.
+
+        @param plugin: The plugin instance.
+        @type plugin: pida.plugin.Plugin
+
+        @param sigtypes: The signal types to index, eg C{('evt',)}.
+        @type sigtypes: sequence of strings
+        """
+        for attrname in dir(plugin):
+            if not '_' in attrname:
+                continue
+            sigtype, signame = attrname.split('_', 1)
+            if sigtype in sigtypes:
+                func = getattr(plugin, attrname)
+                if callable(func):
+                    # Build a new list, the old one may be being dispatched
+                    key = (sigtype, signame)
+                    handlers = self.handlers.get(key, [])
+                    self.handlers[key] = handlers + [(plugin, func)]
+
+    def remove_plugin(self, plugin):
+        """
+        Remove all the handlers belonging to a plugin.
+        """
+        for key in self.handlers.keys():
+            handlers = [h for h in self.handlers[key] if h[0] is not plugin]
+            if handlers:
+                self.handlers[key] = handlers
+            else:
+                del self.handlers[key]
+
+    def get(self, sigtype, signame):
+        """
+        Return the list of (plugin, handler) pairs for a signal.
+        """
+        return self.handlers.get((sigtype, signame), ())
+
 class DummyOpts(object):
     """
     A dummy object to make the transition to the new registry
@@ -74,9 +151,7 @@ class DummyOpts(object):
         self.cb = cb
 
     def get(self, groupname, optname):
-        group = getattr(self.cb.registry, groupname)
-        option = getattr(group, optname)
-        return option.value()
+        return self.cb.registry.get_group(groupname).get(optname).value()
 
 # Instance of this class is passed to every single custom object in Pida,
 # as the cb parameter on instantiation.
@@ -91,6 +166,26 @@ class Application(base.pidaobject):
     def do_init(self):
         # List of plugins loaded used for event passing
         self.plugins = []
+        # Handler index for events, actions and edits
+        self.handlers = HandlerIndex()
+        # Deferred events, and the events which will be deferred
+        self.event_queue = eventqueue.EventQueue(self.deliver_evt,
+                                                 ATTACHED_EVENTS)
+        self.coalesced_events = {}
+        # Handler timings, when instrumented
+        self.handler_stats = None
+        # Main loop stall watchdog, when enabled
+        self.watchdog = None
+        # Watches files edited outside Pida, polling when enabled
+        self.filewatcher = filewatch.FileWatcher()
+        # Times the phases of startup
+        self.timer = diagnostics.NullTimer()
+        # Enabled optional plugins by name, None until they are loaded
+        self.optional_plugins = {}
+        # Manifests of the optional plugins, describing them unloaded
+        self.manifests = {}
+        # name -> (args, kw) of the latest of each replayed event
+        self.replayed_events = {}
         # convenience
         self.OPTPLUGINS = OPTPLUGINS
         # Main config options
@@ -105,31 +200,71 @@ class Application(base.pidaobject):
     def startup(self):
         sys.excepthook = debugwindow.show
         debugwindow.DebugWindow.application = self
+        self.timer = diagnostics.PhaseTimer()
         self.registry = registry.Registry(os.path.expanduser('~/.pida/pida.conf'))
         self.optparser = optparse.OptionParser()
 
        
-        options.configure(self.registry)
+        self.timer.call('configure options', options.configure, self.registry)
 
 
         self.registry.prime_optparser(self.optparser)
         self.optparser.parse_args()
+        if self.registry.profile_dump:
+            self.timer.profile(self.registry.profile_dump, self.load_components)
+        else:
+            self.load_components()
+
+        if self.registry.profile_startup:
+            report = self.timer.report()
+            # stdout has been redirected to the log by now
+            sys.__stdout__.write('%s\n' % report)
+            self.do_log('startup profile\n%s' % report, 20)
+        # Only startup is timed
+        self.timer = diagnostics.NullTimer()
+
+        if self.registry.watchdog.enabled.value():
+            threshold = self.registry.watchdog.threshold.value() / 1000.0
+            self.watchdog = diagnostics.Watchdog(threshold, self.cb_stall)
+            self.watchdog.start()
+
+        # Config files are only watched from here, after startup saved them
+        self.filewatcher.watch(self.registry.filename, self.cb_config_changed)
+        if self.registry.reload.enabled.value():
+            self.filewatcher.start(self.registry.reload.interval.value())
+
+    def cb_config_changed(self, filename):
+        """
+        Called by the file watcher when the config file has been edited.
+        """
+        self.do_log('reloading %s' % filename, 20)
+        # Only the subscribers of changed options are notified
         self.registry.load()
+
+    def load_components(self):
+        """
+        Load the registry, plugins and main window.
+        """
+        self.timer.call('registry load', self.registry.load)
         # now the base plugins
 
         self.do_first_time()
 
-        self.boss = create_plugin('boss', self)
-        self.boss.configure(self.registry)
+        cachefile = os.path.join(self.registry.directories.user.value(),
+                                 'plugins.cache')
+        self.manifests = self.timer.call('load manifests',
+                                         manifest.load_manifests,
+                                         OPTPLUGINS, cachefile)
+
+        self.boss = create_plugin('boss', self, self.timer)
+        self.timer.call('configure boss', self.boss.configure, self.registry)
+        self.handlers.add_plugin(self.boss, ('evt', 'action'))
         shell_plug = self.add_plugin('terminal')
         buffer_plug = self.add_plugin('buffer')
 
-
-        opt_plugs = []
+        # Optional plugins only declare their options until needed
         for plugname in OPTPLUGINS:
-            plugin = self.add_plugin(plugname)
-            if plugin and plugin.VISIBLE:
-                opt_plugs.append(plugin)
+            self.configure_optional_plugin(plugname)
         
         # The editor 
         # editorname = 'vim'
@@ -142,27 +277,33 @@ class Application(base.pidaobject):
        
         #self.evt('init')
        
-        self.registry.load()
-        self.registry.save()
+        self.timer.call('registry reload', self.registry.load)
+        self.timer.call('registry save', self.registry.save)
       
-
+        opt_names = []
         for pluginname in self.OPTPLUGINS:
-            if not self.opts.get('plugins', pluginname):
-                # slow but only once
-                for plugin in self.plugins:
-                    if plugin and plugin.NAME == pluginname:
-                        self.plugins.remove(plugin)
-                        opt_plugs.remove(plugin)
+            if (pluginname in self.manifests and
+                self.opts.get('plugins', pluginname)):
+                self.optional_plugins[pluginname] = None
+                if self.manifests[pluginname].visible:
+                    opt_names.append(pluginname)
 
         self.mainwindow = mainwindow.MainWindow()
 
-        self.evt('populate')
-        self.mainwindow.set_plugins(self.editor, buffer_plug, shell_plug, opt_plugs)
-        self.mainwindow.show_all()
+        self.timer.call('evt populate', self.evt, 'populate')
+        self.timer.call('set plugins', self.mainwindow.set_plugins,
+                        self.editor, buffer_plug, shell_plug, opt_names)
+        self.timer.call('show main window', self.mainwindow.show_all)
+
+        self.timer.call('evt shown', self.evt, 'shown')
+        self.timer.call('evt started', self.evt, 'started')
+        self.timer.call('evt reset', self.evt, 'reset')
 
-        self.evt('shown')
-        self.evt('started')
-        self.evt('reset')
+    def cb_stall(self, stall):
+        """
+        Called by the watchdog after the main loop was blocked.
+        """
+        self.do_log(stall.report(), 30)
         
 
     def do_first_time(self):
@@ -177,52 +318,176 @@ class Application(base.pidaobject):
         """
         Create and return the plugin
         """
-        plugin = create_plugin(name, self)
+        plugin = create_plugin(name, self, self.timer)
         if plugin:
-            plugin.configure(self.registry)
+            self.timer.call('configure %s' % name, plugin.configure,
+                            self.registry)
             self.plugins.append(plugin)
+            self.handlers.add_plugin(plugin, ('evt',))
         return plugin
 
+    def configure_optional_plugin(self, name):
+        """
+        Declare the registry options of an optional plugin from its manifest.
+        """
+        if name in self.manifests:
+            self.manifests[name].configure(self.registry)
+
+    def get_plugin_icon(self, name):
+        """
+        Return the icon name for an optional plugin, without loading it.
+        """
+        return self.manifests[name].icon
+
+    def load_plugin(self, name):
+        """
+        Return the named optional plugin, loading it if it is not loaded.
+
+        A plugin loaded after startup is sent the latest of each of the
+        REPLAYED_EVENTS it missed, then placed in its notebook page.
+
+        @return: The plugin, or None if it is disabled or failed to load.
+        """
+        if not name in self.optional_plugins:
+            return None
+        plugin = self.optional_plugins[name]
+        if plugin is None:
+            plugin = self.add_plugin(name)
+            # Don't retry plugins that failed
+            self.optional_plugins[name] = plugin or False
+            if plugin:
+                self.replay_events(plugin)
+                if 'populate' in self.replayed_events:
+                    self.mainwindow.plugin_loaded(plugin)
+        return plugin or None
+
+    def load_plugins_for_event(self, name):
+        """
+        Load the enabled optional plugins, not yet loaded, whose manifest
+        declares that they handle the named event.
+
+        @return: The plugins loaded.
+        """
+        loaded = []
+        for pluginname in self.OPTPLUGINS:
+            if (self.optional_plugins.get(pluginname, False) is None and
+                self.manifests[pluginname].handles(name)):
+                plugin = self.load_plugin(pluginname)
+                if plugin:
+                    loaded.append(plugin)
+        return loaded
+
+    def replay_events(self, plugin):
+        for name in REPLAYED_EVENTS:
+            if name in self.replayed_events:
+                args, kw = self.replayed_events[name]
+                self.signal_to_plugin(plugin, 'evt', name, *args, **kw)
+
+    def remove_plugin(self, plugin):
+        """
+        Remove a plugin so that it no longer receives events
+        """
+        if plugin in self.plugins:
+            self.plugins.remove(plugin)
+        self.handlers.remove_plugin(plugin)
+
     def set_editor(self, name):
         """
         Set the editor plugin
         """
         self.editor = self.add_plugin(name)
         if self.editor:
+            self.handlers.add_plugin(self.editor, ('edit',))
             return self.editor
         else:
             raise Exception, 'Selected editor failed to load'
 
     def action(self, name, *args, **kw):
-        self.do_log_debug('action: %s' % name)
-        self.signal_to_plugin(self.boss, 'action', name, *args, **kw)
+        self.dispatch('action', name, args, kw)
 
     def edit(self, name, *args, **kw):
-        self.do_log_debug('edit: %s' % name)
-        self.signal_to_plugin(self.editor, 'edit', name, *args, **kw)
+        self.dispatch('edit', name, args, kw)
 
     def evt(self, name, *args, **kw):
         """Callback for events from vim client, propogates them to plugins"""
-        self.do_log_debug('evt: %s' % name)
-        self.signal_to_plugin(self.boss, 'evt', name, *args, **kw)
-        # pass the event to every plugin
-        for plugin in self.plugins:
-            # call the instance method, or an empty lambda
-            self.signal_to_plugin(plugin, 'evt', name, *args, **kw)
+        keyfunc = self.coalesced_events.get(name)
+        if keyfunc is not None:
+            self.event_queue.push(name, keyfunc(*args, **kw), args, kw)
+        else:
+            # Deliver anything deferred first, so plugins see events in order
+            if self.event_queue.has_pending():
+                self.event_queue.flush()
+            self.deliver_evt(name, args, kw)
+
+    def deliver_evt(self, name, args, kw):
+        # Recorded first, so a plugin loaded while handling this event gets it
+        if name in REPLAYED_EVENTS:
+            self.replayed_events[name] = (args, kw)
+        self.dispatch('evt', name, args, kw)
+
+    def reset_events(self):
+        """
+        Set whether bursty events are deferred, from the registry.
+        """
+        if self.registry.events.coalesce.value():
+            self.coalesced_events = COALESCABLE_EVENTS
+        else:
+            self.coalesced_events = {}
+            self.event_queue.flush()
+        self.set_instrumented(self.registry.events.instrument.value())
+
+    def set_instrumented(self, instrumented):
+        """
+        Set whether the time taken by each signal handler is recorded.
+        """
+        if instrumented:
+            if self.handler_stats is None:
+                self.handler_stats = diagnostics.HandlerStats()
+            self.call_handler = self.call_handler_timed
+        else:
+            self.handler_stats = None
+            # Fall back to the uninstrumented class method
+            if 'call_handler' in self.__dict__:
+                del self.call_handler
+
+    def dispatch(self, sigtype, signame, args, kw):
+        """
+        Call every indexed handler for the signal, in plugin load order.
+        """
+        if self.boss.log.isEnabledFor(20):
+            self.do_log_debug('%s: %s' % (sigtype, signame))
+        if sigtype == 'evt' and not signame in REPLAYED_EVENTS:
+            # Loaded plugins handling it, if only with the Plugin defaults,
+            # do not make the plugins declaring it unneeded. Replayed events
+            # reach plugins as they are loaded, so never load them.
+            self.load_plugins_for_event(signame)
+        for plugin, func in self.handlers.get(sigtype, signame):
+            self.call_handler(plugin, sigtype, signame, func, args, kw)
+
+    def call_handler(self, plugin, sigtype, signame, func, args, kw):
+        try:
+            func(*args, **kw)
+            return True
+        except Exception, e:
+            print ('error passing %s "%s" to %s, %s' % (sigtype, signame,
+                                                        plugin, e))
+            return False
+
+    def call_handler_timed(self, plugin, sigtype, signame, func, args, kw):
+        started = time.time()
+        result = Application.call_handler(self, plugin, sigtype, signame,
+                                          func, args, kw)
+        self.handler_stats.record(plugin.NAME, sigtype, signame,
+                                  time.time() - started)
+        return result
 
     def signal_to_plugin(self, plugin, sigtype, signame, *args, **kw):
         funcname = '%s_%s' % (sigtype, signame)
-        if hasattr(plugin, funcname):
-            try:
-                getattr(plugin, funcname)(*args, **kw)
-                return True
-            except Exception, e:
-                print ('error passing %s "%s" to %s, %s' % (sigtype, signame,
-                                                            plugin, e))
-                return False
+        func = getattr(plugin, funcname, None)
+        if func is not None:
+            return self.call_handler(plugin, sigtype, signame, func, args, kw)
         return False
 
-
 import debugwindow
 def main(argv):
     a = Application()
@@ -42,7 +42,7 @@ class MainWindow(base.pidaobject, gtk.Window):
         self.connect('key_press_event', self.cb_key_press)
         # The outer pane
 
-    def set_plugins(self, server_plug, buffer_plug, shell_plug, opt_plugs):
+    def set_plugins(self, server_plug, buffer_plug, shell_plug, opt_names):
         p0 = gtk.HPaned()
         
         pm = gtk.VPaned()
@@ -98,11 +98,14 @@ class MainWindow(base.pidaobject, gtk.Window):
         self.notebook.set_show_border(True)
         self.notebook.set_size_request(200, -1)
         p2.pack2(self.notebook, True, True)
+        # Optional plugins are loaded when their page is first shown
+        self.notebook.connect('switch-page', self.cb_switch_page)
         # Populate with the configured plugins
-        self.opt_plugins = opt_plugs
+        self.opt_plugins = opt_names
         self.opt_windows = {}
-        for plug in opt_plugs:
-            self.add_opt_plugin(plug)
+        self.opt_pages = {}
+        for name in opt_names:
+            self.add_opt_plugin(name)
         self.add_pages(self.prop_boss.get_pluginnames('None'))
 
         if self.prop_main_registry.layout.start_maximised.value():
@@ -111,9 +114,9 @@ class MainWindow(base.pidaobject, gtk.Window):
 
         
     def add_pages(self, pluginnames):
-        for plugin in self.opt_plugins:
-            pluginname = plugin.NAME
-            pagenum = self.notebook.page_num(plugin.win)
+        for pluginname in self.opt_plugins:
+            page = self.opt_windows[pluginname][0]
+            pagenum = self.notebook.page_num(page)
             if pluginname in pluginnames:
                 if pagenum < 0:
                     self.display_plugin(pluginname)
@@ -122,24 +125,44 @@ class MainWindow(base.pidaobject, gtk.Window):
                     self.notebook.remove_page(pagenum)
                 
     
-    def add_opt_plugin(self, plugin):
+    def add_opt_plugin(self, pluginname):
         """
-        Add a plugin to the optional plugin notebook.
+        Add a page for a plugin to the optional plugin notebook.
         
-        @param plugin: An instance of the plugin.
-        @type plugin: pida.plugin.Plugin
+        The plugin itself is packed into the page once it is loaded.
+
+        @param pluginname: The name of the plugin.
+        @type pluginname: string
         """
-        # Remove the toolbar label present by default on plugins
-        plugin.ctlbar.remove(plugin.label)
+        page = gtk.VBox()
+        page.show()
         # create a label with a tooltip/EventBox
         label = gtk.EventBox()
-        self.do_set_tooltip(label, plugin.NAME)
-        im = self.do_get_image(plugin.ICON)
+        self.do_set_tooltip(label, pluginname)
+        im = self.do_get_image(self.pida.get_plugin_icon(pluginname))
         im.show()
         label.add(im)
         
         # store the page fand label for later use
-        self.opt_windows[plugin.NAME] = (plugin.win, label)
+        self.opt_windows[pluginname] = (page, label)
+        self.opt_pages[page] = pluginname
+
+    def plugin_loaded(self, plugin):
+        """
+        Pack a newly loaded optional plugin into its page.
+
+        @param plugin: An instance of the plugin.
+        @type plugin: pida.plugin.Plugin
+        """
+        if not plugin.NAME in self.opt_windows:
+            # Not visible, so it has no page
+            return
+        page, label = self.opt_windows[plugin.NAME]
+        # Remove the toolbar label present by default on plugins
+        plugin.ctlbar.remove(plugin.label)
+        page.pack_start(plugin.win)
+        # The page is already shown, unlike at startup
+        plugin.win.show_all()
 
 
     def display_plugin(self, pluginname):
@@ -148,6 +171,14 @@ class MainWindow(base.pidaobject, gtk.Window):
             self.notebook.append_page(win, tab_label=label)
 
 
+    def cb_switch_page(self, notebook, page, pagenum):
+        """
+        Callback when a notebook page is shown, loading its plugin.
+        """
+        pagewidget = notebook.get_nth_page(pagenum)
+        if pagewidget in self.opt_pages:
+            self.pida.load_plugin(self.opt_pages[pagewidget])
+
     def cb_key_press(self, widget, event):
         """
         Callback to all key press events.
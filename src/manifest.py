@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*- 
+# vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
+# $Id$
+#Copyright (c) 2005 Ali Afshar aafshar@gmail.com
+
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+
+#The above copyright notice and this permission notice shall be included in
+#all copies or substantial portions of the Software.
+
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+"""Plugin manifests, describing plugins without importing them."""
+
+# System imports
+import os
+import logging
+import cPickle as pickle
+import ConfigParser as configparser
+
+# Pida imports
+import configuration.registry as registry
+
+# The manifest file name in each plugin's directory
+MANIFEST_NAME = 'manifest'
+
+# Change this when the pickled manifest format changes
+CACHE_VERSION = 1
+
+PLUGINS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'plugins')
+
+def split_list(data):
+    return [s.strip() for s in data.split(',') if s.strip()]
+
+class PluginManifest(object):
+    """
+    The declared name, icon, filetypes, events and options of a plugin.
+
+    @ivar groups: The registry groups declared by the plugin.
+    @type groups: a C{list} of C{(name, doc, options)}, where options is a
+        C{list} of C{(name, type name, default data, doc, extra attributes)}
+    """
+    def __init__(self, name):
+        self.name = name
+        self.icon = 'fullscreen'
+        self.visible = True
+        self.filetypes = []
+        self.events = []
+        self.groups = []
+
+    def handles(self, eventname):
+        """
+        Whether the plugin declares that it handles the named event, so is
+        loaded for it when not loaded yet. The events replayed to plugins as
+        they are loaded, such as bufferchange, are not declared.
+        """
+        return eventname in self.events
+
+    def configure(self, reg):
+        """
+        Declare the plugin's registry groups and options.
+
+        @param reg: The registry.
+        @type reg: pida.configuration.registry.Registry
+        """
+        for groupname, doc, options in self.groups:
+            group = reg.add_group(groupname, doc)
+            for optname, typename, data, optdoc, extras in options:
+                typ = getattr(registry, typename)
+                entry = group.add_data(optname, typ, data, optdoc)
+                if entry:
+                    for attrname, value in extras:
+                        setattr(entry, attrname, value)
+
+def read_manifest(filename):
+    """
+    Parse a manifest file.
+
+    @return: The manifest.
+    @rtype: L{PluginManifest}
+    """
+    parser = configparser.RawConfigParser()
+    f = open(filename, 'r')
+    parser.readfp(f)
+    f.close()
+    manifest = PluginManifest(parser.get('plugin', 'name'))
+    if parser.has_option('plugin', 'icon'):
+        manifest.icon = parser.get('plugin', 'icon')
+    if parser.has_option('plugin', 'visible'):
+        manifest.visible = parser.getboolean('plugin', 'visible')
+    for attrname in ['filetypes', 'events']:
+        if parser.has_option('plugin', attrname):
+            setattr(manifest, attrname,
+                    split_list(parser.get('plugin', attrname)))
+    groupnames = []
+    if parser.has_option('plugin', 'groups'):
+        groupnames = split_list(parser.get('plugin', 'groups'))
+    for groupname in groupnames:
+        options = []
+        for optname in split_list(parser.get(groupname, 'options')):
+            section = '%s.%s' % (groupname, optname)
+            extras = []
+            if parser.has_option(section, 'choices'):
+                choices = split_list(parser.get(section, 'choices'))
+                extras.append(('choices', choices))
+            if parser.has_option(section, 'adjustment'):
+                adjustment = [int(s) for s in
+                              split_list(parser.get(section, 'adjustment'))]
+                extras.append(('adjustment', tuple(adjustment)))
+            options.append((optname, parser.get(section, 'type'),
+                            parser.get(section, 'default'),
+                            parser.get(section, 'doc'), extras))
+        manifest.groups.append((groupname, parser.get(groupname, 'doc'),
+                                options))
+    return manifest
+
+def manifest_filename(pluginname):
+    return os.path.join(PLUGINS_DIR, pluginname, MANIFEST_NAME)
+
+def load_manifests(pluginnames, cachefile):
+    """
+    Load the manifests of the named plugins.
+
+    Parsed manifests are cached in C{cachefile}, and only reparsed when the
+    manifest file has changed.
+
+    @return: The manifests keyed by plugin name. Plugins without a readable
+        manifest are missing.
+    @rtype: C{dict}
+    """
+    cache = read_cache(cachefile)
+    manifests = {}
+    changed = False
+    for name in pluginnames:
+        filename = manifest_filename(name)
+        try:
+            st = os.stat(filename)
+        except OSError:
+            continue
+        stamp = (filename, st.st_mtime, st.st_size)
+        cached = cache.get(name)
+        if cached and cached[0] == stamp:
+            manifests[name] = cached[1]
+            continue
+        try:
+            manifest = read_manifest(filename)
+        except (IOError, configparser.Error), e:
+            logging.warn('Bad manifest for plugin "%s": %s' % (name, e))
+            continue
+        manifests[name] = manifest
+        cache[name] = (stamp, manifest)
+        changed = True
+    if changed:
+        write_cache(cachefile, cache)
+    return manifests
+
+def read_cache(cachefile):
+    try:
+        f = open(cachefile, 'rb')
+        try:
+            version, cache = pickle.load(f)
+        finally:
+            f.close()
+    except Exception:
+        # Missing or unreadable, it will be rebuilt
+        return {}
+    if version != CACHE_VERSION:
+        return {}
+    return cache
+
+def write_cache(cachefile, cache):
+    try:
+        cachedir = os.path.dirname(cachefile)
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+        f = open(cachefile, 'wb')
+        pickle.dump((CACHE_VERSION, cache), f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+    except (IOError, OSError), e:
+        logging.warn('Unable to write plugin manifest cache: %s' % e)
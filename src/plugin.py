@@ -374,7 +374,10 @@ class CommonEvents(object):
 
     def evt_reset(self):
         """ 
-        Event: called when main configuration has been changed.
+        Event: called when the configuration has been loaded at startup.
+
+        Later changes are only sent to the subscribers of the changed
+        options, see L{pida.configuration.registry.Registry.subscribe}.
         """
         pass
 
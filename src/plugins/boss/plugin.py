@@ -30,6 +30,7 @@ import pida.plugin as plugin
 import pida.gtkextra as gtkextra
 import pida.configuration.registry as registry
 import pida.configuration.config as config
+import pida.debugwindow as debugwindow
 
 class Plugin(plugin.Plugin):
     NAME = "Boss"
@@ -38,14 +39,25 @@ class Plugin(plugin.Plugin):
     def configure(self, reg):
         self.ftregistry = reg.add_group('filetypes',
             'Determines which plugins are displayed for which filetypes.')
+        # The defaults come from the filetypes in the plugin manifests
+        ftdefaults = {'all': [], 'python': []}
+        for pluginname in self.prop_optional_pluginlist:
+            if pluginname in self.pida.manifests:
+                for ft in self.pida.manifests[pluginname].filetypes:
+                    ftdefaults.setdefault(ft, []).append(pluginname)
         self.ftregistry.add('all',
             registry.RegistryItem,
-            'project, pastebin, gazpacho',
+            ', '.join(ftdefaults.pop('all')),
             'What plugins to always use (comma separated)')
         self.ftregistry.add('python',
             registry.RegistryItem,
-            'python_browser, python_debugger, python_profiler',
+            ', '.join(ftdefaults.pop('python')),
             'What plugins to use only for python files (comma separated)')
+        for ft in ftdefaults:
+            self.ftregistry.add(ft,
+                registry.RegistryItem,
+                ', '.join(ftdefaults[ft]),
+                'What plugins to use only for %s files (comma separated)' % ft)
         self.ftregistry.add('None',
             registry.RegistryItem,
             '',
@@ -70,6 +82,10 @@ class Plugin(plugin.Plugin):
         self.loghandler = None
         #logging.basicConfig()
         self.evt_reset()
+        reg = self.prop_main_registry
+        reg.subscribe(self.cb_log_changed, ('files', 'log'), ('log', 'level'))
+        reg.subscribe(self.cb_events_changed, ('events', 'coalesce'),
+                      ('events', 'instrument'))
         #sys.stdout = sys.stderr = file('/dev/null', 'w')
 
         self.tips = gtk.Tooltips()
@@ -77,6 +93,8 @@ class Plugin(plugin.Plugin):
 
         self.child_processes = []
 
+        self.configeditor = None
+
     def evt_populate(self):
         self.icons = gtkextra.Icons()
 
@@ -86,7 +104,15 @@ class Plugin(plugin.Plugin):
     def evt_reset(self):
         self.reset_logger()
         self.reset_io()
+        self.pida.reset_events()
+
+    def cb_log_changed(self, options):
+        self.reset_logger()
+        if self.prop_main_registry.files.log in options:
+            self.reset_io()
 
+    def cb_events_changed(self, options):
+        self.pida.reset_events()
 
     def reset_logger(self):
         logfile = self.prop_main_registry.files.log.value()
@@ -102,7 +128,8 @@ class Plugin(plugin.Plugin):
         sys.stdout = sys.stderr = f
 
     def evt_bufferchange(self, buffernumber, buffername):
-        if not self.filetype_triggered:
+        # The filetype sent may have been for another buffer
+        if not self.filetype_triggered or not buffernumber in self.filetypes:
             self.filetypes[buffernumber] = 'None'
         if self.filetype_current != self.filetypes[buffernumber]:
             self.filetype_current = self.filetypes[buffernumber]
@@ -121,6 +148,10 @@ class Plugin(plugin.Plugin):
             fl = getattr(self.prop_main_registry.filetypes, filetype).value()
             ftplugins = [s.strip() for s in fl.split(',')]
             # No filetypes for the plugin
+        # Plugins for the filetype are needed now, the general plugins are
+        # loaded when their page is shown
+        for name in ftplugins:
+            self.pida.load_plugin(name)
         return genplugins + ftplugins
 
     def get_named_plugin(self, name):
@@ -148,10 +179,22 @@ class Plugin(plugin.Plugin):
 
     def action_showconfig(self, pagename=None):
         """ called to show the config editor """
-        # Create a new configuration editor, and show it.
-        self.configeditor = config.ConfigEditor()
+        # Create the configuration editor the first time, and show it.
+        if self.configeditor is None:
+            self.configeditor = config.ConfigEditor()
         self.configeditor.show(pagename)
 
+    def action_handlerstats(self):
+        """ Show the plugin event handler timings. """
+        debugwindow.show_handler_stats()
+
+    def evt_die(self):
+        if self.pida.watchdog is not None:
+            self.pida.watchdog.stop()
+        stats = self.pida.handler_stats
+        if stats is not None:
+            self.do_log('handlerstats', '\n%s' % stats.report(), 20)
+
     def action_quit(self):
         """ Quit Pida. """
         # Tell plugins to die
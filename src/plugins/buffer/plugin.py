@@ -47,6 +47,8 @@ class BufferTree(gtkextra.Tree):
     '''
     YPAD = 2
     XPAD = 2
+    KEY_COLUMN = 3
+    FILTER_COLUMN = 2
     COLUMNS = [('icon', gtk.gdk.Pixbuf, gtk.CellRendererPixbuf, True,
                 'pixbuf'),
                ('name', gobject.TYPE_STRING, gtk.CellRendererText, True,
@@ -61,7 +63,7 @@ class BufferTree(gtkextra.Tree):
         @param bufferlist: The list of buffers
         @type bufferlist: A list of (number, name) tuples
         '''
-        self.clear()
+        rows = []
         for buf in bufferlist:
             path = ''
             if len(buf) > 1:
@@ -76,11 +78,12 @@ class BufferTree(gtkextra.Tree):
                 mtype = None
             if mtype:
                 mtype = mtype.replace('/','-')
-                im = self.do_get_image(mtype).get_pixbuf()
+                im = self.do_get_pixbuf(mtype)
             else:
-                im = self.do_get_image('text-plain').get_pixbuf()
+                im = self.do_get_pixbuf('text-plain')
             markup = self.beautify(name, dirn, path)
-            self.add_item([im, markup, path, nr])
+            rows.append([im, markup, path, nr])
+        self.update_items(rows)
 
     def beautify(self, name, dirn, path):
         if not name:
@@ -101,11 +104,7 @@ class BufferTree(gtkextra.Tree):
         @param buffernumber: The buffer number to show active.
         @type buffernumber: int
         '''
-        for node in self.model:
-            if node[3] == buffernumber:
-                self.view.set_cursor(node.path)
-                return True
-        return False
+        return self.set_active_key(buffernumber)
 
 class Plugin(plugin.Plugin):
     NAME = 'Buffers'
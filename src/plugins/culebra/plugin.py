@@ -97,6 +97,11 @@ class Plugin(plugin.Plugin):
 
     def evt_started(self):
         self.launch()
+        self.prop_main_registry.subscribe(self.cb_font_changed,
+                                          ('culebra', 'font'))
+
+    def cb_font_changed(self, options):
+        self.evt_reset()
         
     def evt_debuggerframe(self, frame):
         if not frame.filename.startswith('<'):
@@ -27,6 +27,12 @@ import gobject
 # system imports
 import os
 import re
+import cgi
+import stat
+import time
+import threading
+import signal
+import subprocess
 import ConfigParser
 # Pida imports
 import pida.configuration.registry as registry
@@ -34,6 +40,8 @@ import pida.configuration.config as config
 import pida.plugin as plugin
 import pida.gtkextra as gtkextra
 import pida.base as base
+import pida.fileindex as fileindex
+import pida.projectsearch as projectsearch
 
 VCS_NONE = 0
 VCS_DARCS = 1
@@ -47,8 +55,148 @@ VCS = {VCS_NONE: 'None',
        VCS_SVN: 'SVN',
        VCS_MERC: 'Mercurial'}
 
+# The marker directory of each system, in order of preference
+VCS_MARKERS = [('_darcs', VCS_DARCS),
+               ('.svn', VCS_SVN),
+               ('CVS', VCS_CVS),
+               ('.hg', VCS_MERC)]
+
+# The colour each status letter is shown in, in the file list
+VCS_STATUS_COLORS = {'M': '#c08000',
+                     'A': '#008000',
+                     'R': '#c00000',
+                     'D': '#c00000',
+                     '!': '#c00000',
+                     'C': '#ff0000',
+                     '?': '#808080',
+                     '*': '#c08000'}
+
+# The seconds a status command may run for
+VCS_STATUS_TIMEOUT = 30
+
 CWD = '__current__working_directory__'
 
+class DirectoryCache(object):
+    """
+    Listings of directories, kept until the modification time of the
+    directory changes.
+    """
+
+    def __init__(self):
+        # path -> (mtime, [(name, isdir)])
+        self.listings = {}
+
+    def get_mtime(self, path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def list(self, path):
+        """
+        Return the entries of a directory.
+
+        @return: The name of each entry and whether it is a directory.
+        @rtype: C{list} of C{(name, isdir)}
+        """
+        return self.scan(path)[1]
+
+    def scan(self, path):
+        """
+        Return the modification time and entries of a directory, see
+        L{list}.
+        """
+        mtime = self.get_mtime(path)
+        if mtime is None:
+            return None, []
+        cached = self.listings.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached
+        try:
+            names = os.listdir(path)
+        except OSError:
+            names = []
+        entries = []
+        for name in names:
+            try:
+                isdir = stat.S_ISDIR(os.stat(os.path.join(path, name)).st_mode)
+            except OSError:
+                # A broken link
+                isdir = False
+            entries.append((name, isdir))
+        self.listings[path] = (mtime, entries)
+        return mtime, entries
+
+    def is_fresh(self, path, mtime):
+        """ Whether the directory is unchanged since it had mtime. """
+        return mtime is not None and self.get_mtime(path) == mtime
+
+directory_cache = DirectoryCache()
+
+# The time in seconds the main loop may spend adding scanned rows at once
+SCAN_CHUNK_TIME = 0.02
+
+EMPTY_ROW = 'empty...'
+LOADING_ROW = 'loading...'
+
+class DirectoryScan(object):
+    """
+    A listing of a directory made in a worker thread, so that slow disks do
+    not block the user interface.
+
+    The thread only lists and sorts. The callback is called in the main
+    loop when it is done, unless the scan was cancelled first.
+    """
+
+    def __init__(self, path, exclude, placeholder, callback):
+        """
+        @param exclude: The compiled pattern of names to leave out, or None.
+        @param placeholder: The reference of the row shown while loading.
+        @type placeholder: gtk.TreeRowReference
+        @param callback: Called with the scan when it is done.
+        """
+        self.path = path
+        self.exclude = exclude
+        self.placeholder = placeholder
+        self.callback = callback
+        self.cancelled = False
+        self.mtime = None
+        self.files = []
+        # (name, path, isdir), last first so they are popped in order
+        self.pending = []
+        self.count = 0
+
+    def start(self):
+        worker = threading.Thread(target=self.run)
+        worker.setDaemon(True)
+        worker.start()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        mtime, entries = directory_cache.scan(self.path)
+        dirs = []
+        files = []
+        for name, isdir in entries:
+            if self.exclude is not None and self.exclude.match(name):
+                continue
+            fp = os.path.join(self.path, name)
+            if isdir:
+                dirs.append(('%s%s' % (name, os.path.sep), fp, True))
+            else:
+                files.append((name, fp, False))
+        dirs.sort()
+        files.sort()
+        pending = dirs + files
+        pending.reverse()
+        self.mtime = mtime
+        self.files = [f[1] for f in files]
+        self.count = len(pending)
+        self.pending = pending
+        if not self.cancelled:
+            gobject.idle_add(self.callback, self)
+
 class EntryWrapper(base.pidaobject, gtk.Entry):
 
     def do_init(self, *args):
@@ -127,19 +275,41 @@ class ProjectRegistry(base.pidaobject, ConfigParser.ConfigParser):
         Load the disk data into memory.
         
         This method checks the loaded attributes, replacing bad/missing
-        attributes with sensible defaults.
+        attributes with sensible defaults. Projects no longer on disk are
+        removed.
+
+        @return: The names of the projects added, changed or removed.
+        @rtype: C{list}
         """
         tempopts = ConfigParser.ConfigParser()
+        loaded = []
+        changed = []
         if os.path.exists(self.filename):
             f = open(self.filename, 'r')
             tempopts.readfp(f)
             f.close()
-            kw = {}
             for section in tempopts.sections():
                 if not section == CWD and tempopts.has_option(section, 'directory'):
+                    kw = {}
                     for option in tempopts.options(section):
                         kw[option] = tempopts.get(section, option)
+                    old = self.get_attributes(section)
                     self.set_project(section, **kw)
+                    if self.get_attributes(section) != old:
+                        changed.append(section)
+                    loaded.append(section)
+        for section in self.sections():
+            if not section == CWD and not section in loaded:
+                self.remove_section(section)
+                changed.append(section)
+        return changed
+
+    def get_attributes(self, projname):
+        """
+        Return the raw attributes of a project, or None if it is missing.
+        """
+        if self.has_section(projname):
+            return dict(self.items(projname, raw=True))
 
     def save(self):
         """
@@ -303,52 +473,139 @@ class FileTree(gtkextra.Tree):
         #self.view.connect('row-expanded', self.cb_expand)
         self.view.connect('test-expand-row', self.cb_expand)
         
+        # The names are marked up only for the rows rendered
+        column = self.view.get_column(0)
+        column.set_cell_data_func(column.get_cell_renderers()[0],
+                                  self.cb_render_name)
+        self.dircolor = None
+        self.exclude = None
+        self.reset_options()
+        self.prop_main_registry.subscribe(self.cb_options_changed,
+            ('project_browser', 'color_directory'),
+            ('project_browser', 'tree_exclude'),
+            ('project_browser', 'pattern_exclude'))
 
         self.root = None
+        # path -> mtime, of the directories shown
+        self.shown_dirs = {}
+        # The scans not yet shown
+        self.scans = []
+        self.vcs_status = None
+
+    def reset_options(self):
+        reg = self.prop_main_registry.project_browser
+        self.dircolor = reg.color_directory.value()
+        self.exclude = None
+        if reg.tree_exclude.value():
+            self.exclude = re.compile(reg.pattern_exclude.value())
+
+    def cb_options_changed(self, options):
+        self.reset_options()
+        self.reload()
+
+    def cb_render_name(self, column, renderer, model, niter):
+        name = cgi.escape(model.get_value(niter, 0))
+        # Directories always have children, if only the placeholder
+        if model.iter_has_child(niter):
+            mu = '<span size="small" foreground="%s">%s</span>' % (
+                self.dircolor, name)
+        else:
+            mu = '<span size="small">%s</span>' % name
+        if self.vcs_status is not None:
+            status = self.vcs_status.get(model.get_value(niter, 1))
+            if status is not None:
+                mu = ('%s <span size="small" weight="bold" foreground="%s">'
+                      '%s</span>' % (mu, VCS_STATUS_COLORS.get(status,
+                      '#000000'), cgi.escape(status)))
+        renderer.set_property('markup', mu)
+
+    def set_vcs_status(self, vcs_status):
+        """
+        Set the version control status shown, or None for none.
+
+        @type vcs_status: L{VcsStatus}
+        """
+        if self.vcs_status is not None:
+            self.vcs_status.unsubscribe(self.cb_vcs_status_changed)
+        self.vcs_status = vcs_status
+        if vcs_status is not None:
+            vcs_status.subscribe(self.cb_vcs_status_changed)
+        self.view.queue_draw()
+
+    def cb_vcs_status_changed(self, vcs_status):
+        self.view.queue_draw()
         
     def set_root(self, path, parent=None):
         if not parent and path == self.root:
             return
-        def small(s):
-            return '<span size="small">%s</span>' % s
-        def smallblue(s):
-            dircol = self.prop_main_registry.project_browser.color_directory.value()
-            return '<span size="small" foreground="%s">%s</span>' % (dircol,s)
         if path == 'None':
             return
-        dirs = []
-        files = []
-        try:
-            flist = os.listdir(path)
-        except OSError:
-            flist = []
-        if self.prop_main_registry.project_browser.tree_exclude.value():
-            r = self.prop_main_registry.project_browser.pattern_exclude.value()
-            pattern = re.compile(r)
-            flist = [fn for fn in flist if not pattern.match(fn)]
-        for fn in flist:
-            fp = os.path.join(path, fn)
-            if os.path.isdir(fp):
-                dirs.append((smallblue('%s%s' % (fn, os.path.sep)), fp))
-            else:
-                files.append((small(fn), fp))
         if not parent:
+            # Anything still loading is for the old root
+            self.cancel_scans()
+            self.shown_dirs = {}
             self.root = path
             self.set_dir_label(path)
             #self.add_item([smallblue('../'), os.path.split(path)[0]])
-        dirs.sort()
-        for d in dirs:
-            par = self.add_item(d, parent)
-            self.add_item([small('empty...'), ''], par)
-        files.sort()
-        for f in files:
-            par = self.add_item(f, parent)
-        self.update()
-        return len(dirs + files)
+            placeholder = self.add_item([LOADING_ROW, ''])
+        else:
+            placeholder = self.model.iter_children(parent)
+            self.set(placeholder, 0, LOADING_ROW)
+        ref = gtk.TreeRowReference(self.model,
+                                   self.model.get_path(placeholder))
+        scan = DirectoryScan(path, self.exclude, ref, self.cb_scanned)
+        self.scans.append(scan)
+        scan.start()
+
+    def cancel_scans(self):
+        for scan in self.scans:
+            scan.cancel()
+        self.scans = []
+
+    def cb_scanned(self, scan):
+        if self.is_stale(scan):
+            return False
+        self.shown_dirs[scan.path] = scan.mtime
+        gobject.idle_add(self.cb_add_scanned, scan)
+        return False
+
+    def is_stale(self, scan):
+        return scan.cancelled or not scan.placeholder.valid()
+
+    def cb_add_scanned(self, scan):
+        """
+        Add the rows of a scan before its placeholder, a chunk at a time.
+        """
+        if self.is_stale(scan):
+            return False
+        placeholder = self.model.get_iter(scan.placeholder.get_path())
+        parent = self.model.iter_parent(placeholder)
+        deadline = time.time() + SCAN_CHUNK_TIME
+        while scan.pending:
+            name, fp, isdir = scan.pending.pop()
+            niter = self.model.insert_before(parent, placeholder, [name, fp])
+            if isdir:
+                self.add_item([EMPTY_ROW, ''], niter)
+            if time.time() > deadline:
+                # Continued in the next idle call
+                return True
+        if parent is None or scan.count:
+            self.model.remove(placeholder)
+        else:
+            self.set(placeholder, 0, EMPTY_ROW)
+        if scan in self.scans:
+            self.scans.remove(scan)
+        if self.vcs_status is not None:
+            self.vcs_status.check(scan.path, scan.files)
+        return False
    
     def refresh(self, force=False):
         root = self.root
         if force:
+            if self.vcs_status is not None:
+                self.vcs_status.refresh()
+            if self.is_unchanged():
+                return
             self.clear()
             self.root = None
         if self.selected(0) == CWD:
@@ -357,6 +614,23 @@ class FileTree(gtkextra.Tree):
             self.set_root(root)
         self.update()
     
+    def reload(self):
+        """ Rebuild the tree, even if nothing has changed on disk. """
+        root = self.root
+        if root:
+            self.clear()
+            self.root = None
+            self.set_root(root)
+
+    def is_unchanged(self):
+        """ Whether none of the directories shown have changed on disk. """
+        if not self.shown_dirs:
+            return False
+        for path, mtime in self.shown_dirs.iteritems():
+            if not directory_cache.is_fresh(path, mtime):
+                return False
+        return True
+
     def up(self):
         if self.root and self.root != '/':
             self.clear()
@@ -380,10 +654,10 @@ class FileTree(gtkextra.Tree):
 
     def cb_expand(self, tv, parent, path):
         child = self.model.iter_children(parent)
-        if self.get(child, 1) == '':
+        # Not already loaded, or loading
+        if self.get(child, 1) == '' and self.get(child, 0) == EMPTY_ROW:
             root = self.get(parent, 1)
-            if self.set_root(root, parent):
-                self.model.remove(child)
+            self.set_root(root, parent)
          
     def l_cb_activated(self, tv, path, niter):
         niter = self.model.get_iter(path)
@@ -446,19 +720,20 @@ class ProjectTree(gtkextra.Tree):
                 'text'),
                ('Display', gobject.TYPE_STRING, gtk.CellRendererText, True,
                 'markup')]
+    KEY_COLUMN = 0
+    FILTER_COLUMN = 0
    
     def populate(self, project_registry, cwd=None):
         self.project_registry = project_registry
-        act = self.selected(0)
-        self.clear()
+        rows = []
         if cwd:
-            self.add_item([CWD, self.beautify('<span foreground="#c00000">'
-                                              'Current Directory</span>', cwd)])
+            rows.append([CWD, self.beautify('<span foreground="#c00000">'
+                                            'Current Directory</span>', cwd)])
         for name in self.project_registry.sections():
             wd = self.project_registry.get(name, 'directory')
-            self.add_item([name, self.beautify(name, wd)])
-        if act:
-            self.set_active(act)
+            rows.append([name, self.beautify(name, wd)])
+        # The selection is kept, as only changed rows are touched
+        self.update_items(rows)
           
     def beautify(self, name, directory):
         vcs = get_vcs_name_for_directory(directory)
@@ -470,11 +745,7 @@ class ProjectTree(gtkextra.Tree):
         return b
         
     def set_active(self, i):
-        for node in self.model:
-            if node[0] == i:
-                self.view.set_cursor(node.path)
-                return True
-        return False
+        return self.set_active_key(i)
 
     def change_cwd(self, cwd):
         niter = self.model[0].iter
@@ -484,30 +755,267 @@ class ProjectTree(gtkextra.Tree):
             if self.selected(0) == CWD:
                 self.cb_selected()
 
+class QuickOpenTree(gtkextra.Tree):
+    COLUMNS = [('name', gobject.TYPE_STRING, gtk.CellRendererText, True,
+                'markup'),
+               ('file', gobject.TYPE_STRING, None, False,
+                'text')]
+
+    def populate(self, paths):
+        self.clear()
+        rows = []
+        for path in paths:
+            directory, name = os.path.split(path)
+            if directory:
+                mu = ('<span size="small"><b>%s</b>\n'
+                      '<span foreground="#606060">%s</span></span>' %
+                      (cgi.escape(name), cgi.escape(directory)))
+            else:
+                mu = ('<span size="small"><b>%s</b></span>' %
+                      cgi.escape(name))
+            rows.append((mu, path))
+        self.add_items(rows)
+        if rows:
+            self.view.set_cursor((0,))
+
+class QuickOpen(gtk.Window):
+    """
+    A popup for opening a file of a project by typing part of its path.
+    """
+
+    def __init__(self, parent, callback):
+        """
+        @param callback: Called with the full path of the file chosen.
+        """
+        gtk.Window.__init__(self)
+        self.set_title('PIDA Quick Open')
+        self.set_transient_for(parent)
+        self.set_size_request(480, 360)
+        self.callback = callback
+        self.root = None
+        self.matcher = None
+        vb = gtk.VBox()
+        self.add(vb)
+        self.entry = gtk.Entry()
+        vb.pack_start(self.entry, expand=False)
+        self.entry.connect('changed', self.cb_changed)
+        self.entry.connect('key-press-event', self.cb_key)
+        self.entry.connect('activate', self.cb_activate)
+        self.status = gtk.Label()
+        vb.pack_start(self.status, expand=False)
+        self.results = QuickOpenTree()
+        vb.pack_start(self.results.win)
+        self.results.connect_activate(self.cb_activate)
+        self.connect('delete-event', self.cb_delete)
+
+    def set_root(self, root, matcher):
+        """
+        Set the project searched, and its matcher or None while indexing.
+        """
+        if root != self.root:
+            self.entry.set_text('')
+        self.root = root
+        self.set_matcher(matcher)
+
+    def set_matcher(self, matcher):
+        self.matcher = matcher
+        if matcher is None:
+            self.status.set_markup('<span size="small">Indexing...</span>')
+        else:
+            self.status.set_markup('<span size="small">%s files</span>' %
+                                   len(matcher.paths))
+        self.refresh()
+
+    def refresh(self):
+        if self.matcher is None:
+            self.results.clear()
+        else:
+            self.results.populate(self.matcher.match(self.entry.get_text()))
+
+    def cb_changed(self, entry):
+        self.refresh()
+
+    def cb_key(self, entry, event):
+        name = gtk.gdk.keyval_name(event.keyval)
+        if name == 'Escape':
+            self.hide()
+            return True
+        elif name in ['Up', 'Down']:
+            path = self.results.selected_path()
+            if path is None:
+                return True
+            i = path[0]
+            if name == 'Up':
+                i = i - 1
+            else:
+                i = i + 1
+            if 0 <= i < len(self.results.model):
+                self.results.view.set_cursor((i,))
+            return True
+        return False
+
+    def cb_activate(self, *args):
+        relpath = self.results.selected(1)
+        if relpath:
+            self.hide()
+            self.callback(os.path.join(self.root, relpath))
+
+    def cb_delete(self, *args):
+        self.hide()
+        return True
+
+class SearchResultsTree(gtkextra.Tree):
+    COLUMNS = [('name', gobject.TYPE_STRING, gtk.CellRendererText, True,
+                'markup'),
+               ('file', gobject.TYPE_STRING, None, False,
+                'text'),
+               ('line', gobject.TYPE_INT, None, False,
+                'text')]
+
+    def init(self):
+        self.root = None
+        # Autosizing would measure every row as each batch is appended
+        column = self.view.get_column(0)
+        column.set_sizing(gtk.TREE_VIEW_COLUMN_FIXED)
+        column.set_expand(True)
+
+    def set_root(self, root):
+        self.root = root
+
+    def add_hits(self, hits):
+        # Appended with the view attached, unlike add_items, so the cursor
+        # and scroll position stay as hits stream in
+        for filename, line, column, text in hits:
+            relpath = filename[len(self.root):].lstrip(os.path.sep)
+            mu = ('<span size="small"><b>%s</b>:%s\n'
+                  '<span foreground="#606060">%s</span></span>' %
+                  (cgi.escape(relpath), line,
+                   cgi.escape(text)))
+            self.model.append(None, (mu, filename, line))
+
+class ProjectSearchWindow(gtk.Window):
+    """
+    A window for searching the contents of the files of a project.
+    """
+
+    def __init__(self, parent, callback):
+        """
+        @param callback: Called with the filename and line of a hit chosen.
+        """
+        gtk.Window.__init__(self)
+        self.set_title('PIDA Project Search')
+        self.set_transient_for(parent)
+        self.set_size_request(560, 400)
+        self.callback = callback
+        self.root = None
+        self.exclude = None
+        self.search = None
+        vb = gtk.VBox()
+        self.add(vb)
+        hb = gtk.HBox()
+        vb.pack_start(hb, expand=False)
+        self.entry = gtk.Entry()
+        hb.pack_start(self.entry)
+        self.entry.connect('activate', self.cb_find)
+        self.regex = gtk.CheckButton(label='Regular expression')
+        hb.pack_start(self.regex, expand=False)
+        self.ignorecase = gtk.CheckButton(label='Ignore case')
+        hb.pack_start(self.ignorecase, expand=False)
+        self.find_b = gtk.Button(stock=gtk.STOCK_FIND)
+        hb.pack_start(self.find_b, expand=False)
+        self.find_b.connect('clicked', self.cb_find)
+        self.stop_b = gtk.Button(stock=gtk.STOCK_STOP)
+        hb.pack_start(self.stop_b, expand=False)
+        self.stop_b.connect('clicked', self.cb_stop)
+        self.stop_b.set_sensitive(False)
+        self.status = gtk.Label()
+        vb.pack_start(self.status, expand=False)
+        self.results = SearchResultsTree()
+        vb.pack_start(self.results.win)
+        self.results.connect_activate(self.cb_activate)
+        self.connect('delete-event', self.cb_delete)
+
+    def set_root(self, root, exclude):
+        """
+        Set the directory searched.
+
+        @param exclude: The compiled pattern of names to leave out, or None.
+        """
+        self.root = root
+        self.exclude = exclude
+        self.set_status('Search in %s' %
+                        root.replace(os.path.expanduser('~'), '~'))
+
+    def set_status(self, text):
+        self.status.set_markup('<span size="small">%s</span>' %
+                               cgi.escape(text))
+
+    def find(self, query):
+        self.stop()
+        if not query or not self.root:
+            return
+        try:
+            pattern, flags = projectsearch.get_pattern(query,
+                not self.regex.get_active(), self.ignorecase.get_active())
+        except re.error, e:
+            self.set_status('Bad regular expression: %s' % e)
+            return
+        self.results.clear()
+        self.results.set_root(self.root)
+        self.search = projectsearch.ProjectSearch(self.root, pattern, flags,
+            self.exclude, self.cb_hits, self.cb_done)
+        self.search.start()
+        self.stop_b.set_sensitive(True)
+        self.set_status('Searching...')
+
+    def stop(self):
+        if self.search is not None:
+            self.search.cancel()
+            self.search = None
+        self.stop_b.set_sensitive(False)
+
+    def cb_hits(self, hits):
+        self.results.add_hits(hits)
+        self.set_status('Searching... %s hits' % len(self.results.model))
+
+    def cb_done(self, search):
+        if search is not self.search:
+            # Cancelled, or replaced by a new search
+            return
+        self.search = None
+        self.stop_b.set_sensitive(False)
+        count = len(self.results.model)
+        if search.count >= projectsearch.MAX_HITS:
+            self.set_status('%s hits in %s files, stopped' %
+                            (count, search.files))
+        else:
+            self.set_status('%s hits in %s files' % (count, search.files))
+
+    def cb_find(self, *args):
+        self.find(self.entry.get_text())
+
+    def cb_stop(self, *args):
+        self.stop()
+        self.set_status('Stopped, %s hits' % len(self.results.model))
+
+    def cb_activate(self, *args):
+        filename = self.results.selected(1)
+        if filename:
+            self.callback(filename, self.results.selected(2))
+
+    def cb_delete(self, *args):
+        self.stop()
+        self.hide()
+        return True
+
 class Plugin(plugin.Plugin):
     NAME = 'project'
     ICON = 'project'
     DICON = 'terminal', 'Open a terminal in this directory.'
 
     def configure(self, reg):
-        self.registry = reg.add_group('project_browser',
-                                      'Options for the project browser.')
-
-        self.registry.add('color_directory',
-                          registry.Color,
-                          '#0000c0',
-                          'Colour used for directories in file list')
-        
-        self.registry.add('tree_exclude',
-                          registry.Boolean,
-                          1,
-                          'Exclude patterns from tree file list view.')
- 
-        self.registry.add('pattern_exclude',
-                          registry.RegistryItem,
-                          '^(CVS|_darcs|\.svn|\..*\.swp)$',
-                          'The files to be excluded from the file tree view.')
-
+        # The group is declared by the plugin manifest
+        self.registry = reg.project_browser
 
     def populate_widgets(self):
         self.vcsbar = gtk.EventBox()
@@ -534,6 +1042,10 @@ class Plugin(plugin.Plugin):
                         'Add project to workbench.')
         self.add_button('editor', self.cb_project_edit,
                         'Edit projects on workbench.')
+        self.add_button('open', self.cb_quickopen,
+                        'Open a file of the project by name.')
+        self.add_button('find', self.cb_projectsearch,
+                        'Search the files of the project.')
    
 
         self.current_directory = os.getcwd()
@@ -543,8 +1055,19 @@ class Plugin(plugin.Plugin):
         self.config = ProjectRegistry(conffile)
         self.config.load()
         self.projects.populate(self.config, self.current_directory)
+        self.pida.filewatcher.watch(conffile, self.cb_projects_file_changed)
 
         self.editor = None
+        self.quickopen = None
+        self.searchwindow = None
+        self.last_buffer = []
+        # root -> [index, matcher or None, whether it is being updated]
+        self.indexes = {}
+        self.prop_main_registry.subscribe(self.cb_options_changed,
+            ('project_browser', 'tree_exclude'),
+            ('project_browser', 'pattern_exclude'))
+        self.prop_main_registry.subscribe(self.cb_vcs_status_option_changed,
+            ('project_browser', 'vcs_status'))
 
         self.maps = create_vcs_maps(self.cb_vcs_command)
 
@@ -585,6 +1108,7 @@ class Plugin(plugin.Plugin):
         if path != self.files.root:
             self.files.clear()
             self.files.set_root(path)
+        self.update_vcs_status(path)
         vcs = get_vcs_for_directory(path)
 
         curbar = self.vcsbar.get_child()
@@ -595,6 +1119,22 @@ class Plugin(plugin.Plugin):
             self.vcsbar.add(newbar)
             self.vcsbar.show_all()
 
+    def update_vcs_status(self, path):
+        """
+        Show the status of the working copy a directory is in, if any.
+        """
+        vcs_status = None
+        vcs, root = vcs_cache.get(path)
+        if (vcs in self.maps and self.maps[vcs].STATUS_ARGS is not None and
+            self.registry.vcs_status.value()):
+            vcs_status = get_vcs_status(self.maps[vcs], root)
+        if vcs_status is not self.files.vcs_status:
+            self.files.set_vcs_status(vcs_status)
+
+    def cb_vcs_status_option_changed(self, options):
+        if self.files.root:
+            self.update_vcs_status(self.files.root)
+
     def cb_project_rclick(self, ite, time):
         pass
 
@@ -609,14 +1149,122 @@ class Plugin(plugin.Plugin):
     def cb_project_edit(self, *args):
         self.show_editor()
 
-    def cb_alternative(self, *a):
+    def get_project_directory(self):
+        """
+        Return the directory of the selected project, or None.
+        """
         name = self.projects.selected(0)
         if not name:
-            return
+            return None
         if name == CWD:
-            wd = self.current_directory
+            return self.current_directory
         else:
-            wd = self.config.get(name, 'directory')
+            return self.config.get(name, 'directory')
+
+    def show_quickopen(self):
+        root = self.get_project_directory()
+        if not root:
+            self.message('No project selected')
+            return
+        if self.quickopen is None:
+            self.quickopen = QuickOpen(self.pida.mainwindow,
+                                       self.cb_quickopen_file)
+        entry = self.update_index(root)
+        self.quickopen.set_root(root, entry[1])
+        self.quickopen.show_all()
+        self.quickopen.entry.grab_focus()
+
+    def show_projectsearch(self):
+        root = self.get_project_directory()
+        if not root:
+            self.message('No project selected')
+            return
+        if self.searchwindow is None:
+            self.searchwindow = ProjectSearchWindow(self.pida.mainwindow,
+                                                    self.cb_search_hit)
+        exclude = None
+        if self.registry.tree_exclude.value():
+            exclude = re.compile(self.registry.pattern_exclude.value())
+        self.searchwindow.set_root(root, exclude)
+        self.searchwindow.show_all()
+        self.searchwindow.entry.grab_focus()
+
+    def update_index(self, root):
+        """
+        Bring the file index of a project root up to date in a worker
+        thread.
+
+        @return: The index entry of the root, see C{self.indexes}.
+        """
+        entry = self.indexes.get(root)
+        if entry is None:
+            reg = self.registry
+            exclude = None
+            if reg.tree_exclude.value():
+                exclude = reg.pattern_exclude.value()
+            filename = fileindex.get_index_filename(
+                self.prop_main_registry.directories.index.value(), root)
+            index = fileindex.FileIndex(root, filename, exclude)
+            entry = self.indexes[root] = [index, None, False]
+        if not entry[2]:
+            entry[2] = True
+            worker = threading.Thread(target=self.index_project,
+                                      args=(root, entry))
+            worker.setDaemon(True)
+            worker.start()
+        return entry
+
+    def index_project(self, root, entry):
+        # Run in the worker thread
+        index, matcher, updating = entry
+        try:
+            try:
+                if matcher is None:
+                    index.load()
+                if index.update() or matcher is None:
+                    matcher = fileindex.FuzzyMatcher(index.paths)
+                    index.save()
+            except (OSError, IOError), e:
+                # Not saved, but still usable
+                matcher = fileindex.FuzzyMatcher(index.paths)
+            except Exception, e:
+                # A bad saved index, which is built again from scratch
+                index.dirs = {}
+                index.update()
+                matcher = fileindex.FuzzyMatcher(index.paths)
+        finally:
+            # Always, or the project would stay marked as being indexed
+            gobject.idle_add(self.cb_index_updated, root, entry, matcher)
+
+    def cb_index_updated(self, root, entry, matcher):
+        entry[1] = matcher
+        entry[2] = False
+        if (self.indexes.get(root) is entry and self.quickopen is not None
+            and self.quickopen.root == root):
+            self.quickopen.set_matcher(matcher)
+        return False
+
+    def cb_options_changed(self, options):
+        # The indexes are rebuilt with the new exclusions when next used
+        self.indexes = {}
+
+    def cb_quickopen(self, *args):
+        self.show_quickopen()
+
+    def cb_quickopen_file(self, filename):
+        self.do_edit('openfile', filename)
+
+    def cb_projectsearch(self, *args):
+        self.show_projectsearch()
+
+    def cb_search_hit(self, filename, line):
+        self.do_edit('openfile', filename)
+        self.do_edit('gotoline', line)
+
+    def cb_alternative(self, *a):
+        wd = self.get_project_directory()
+        if not wd:
+            return
         shell = self.prop_main_registry.commands.shell.value()
         self.do_action('newterminal', shell, directory=wd)
 
@@ -624,10 +1272,24 @@ class Plugin(plugin.Plugin):
         self.config.load()
         self.projects.populate(self.config, self.current_directory)
 
+    def cb_projects_file_changed(self, filename):
+        if self.config.load():
+            self.projects.populate(self.config, self.current_directory)
+
     def evt_bufferchange(self, nr, name):
         cwd = os.path.split(name)[0]
         self.current_directory = cwd
         self.projects.change_cwd(cwd)
+        # The buffer left may have been saved
+        if self.files.vcs_status is not None:
+            self.files.vcs_status.check_files(self.last_buffer)
+        self.last_buffer = [name]
+
+    def evt_quickopen(self):
+        self.show_quickopen()
+
+    def evt_projectsearch(self):
+        self.show_projectsearch()
 
     def evt_projectexecute(self, arg):
         name = self.projects.selected(0)
@@ -642,6 +1304,9 @@ class Plugin(plugin.Plugin):
 class VersionControlSystem(base.pidaobject):
     COMMAND = ''
     ARGS = []
+    # The arguments listing changed files, or None when the status is not
+    # shown in the file list
+    STATUS_ARGS = None
 
     def do_init(self, callbackfunc):
         self.callbackfunc = callbackfunc
@@ -666,6 +1331,27 @@ class VersionControlSystem(base.pidaobject):
         cargs = [self, command]
         return self.toolbar.add_button(icon, self.callbackfunc, tooltip, cargs)
 
+    def get_status_command(self, paths=None):
+        """
+        Return the command listing the changed files under the working copy
+        root, or only the paths given.
+
+        @param paths: Paths relative to the working copy root.
+        """
+        return [self.COMMAND] + self.STATUS_ARGS + (paths or [])
+
+    def parse_status(self, output):
+        """
+        Return the status letter and path of each file in the output of
+        the status command, with paths relative to the working copy root.
+        """
+        statuses = []
+        for line in output.splitlines():
+            parts = line.split(None, 1)
+            if len(parts) == 2 and len(parts[0]) == 1:
+                statuses.append((parts[1], parts[0]))
+        return statuses
+
     def launch(self, args, **kw):
         icon = 'vcs_%s' % self.ARGS[0]
         commandargs = ' '.join([self.COMMAND] + args)
@@ -690,6 +1376,19 @@ class Cvs(VersionControlSystem):
 class Darcs(VersionControlSystem):
     COMMAND = '/usr/bin/darcs'
     ARGS = ['darcs']
+    STATUS_ARGS = ['whatsnew', '--summary', '--look-for-adds']
+
+    def parse_status(self, output):
+        # Lines like "M ./file -1 +2", with "a" for files not added
+        statuses = []
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and parts[0] in ['M', 'A', 'R', 'a']:
+                status = parts[0]
+                if status == 'a':
+                    status = '?'
+                statuses.append((os.path.normpath(parts[1]), status))
+        return statuses
 
     def command_commit(self, **kw):
         self.launch(['record'], **kw)
@@ -707,6 +1406,21 @@ class Darcs(VersionControlSystem):
 class Subversion(VersionControlSystem):
     COMMAND = 'svn'
     ARGS = ['svn']
+    STATUS_ARGS = ['status', '--non-interactive']
+
+    def parse_status(self, output):
+        # Status columns, then the path from the eighth or ninth character
+        statuses = []
+        for line in output.splitlines():
+            if len(line) < 8 or line.startswith('Performing'):
+                continue
+            status = line[0]
+            if status == ' ':
+                # Only the properties changed
+                status = line[1]
+            if status != ' ':
+                statuses.append((line[7:].strip(), status))
+        return statuses
 
     def command_update(self, **kw):
         self.launch(['update'], **kw)
@@ -734,6 +1448,7 @@ class Subversion(VersionControlSystem):
 class Mercurial(VersionControlSystem):
     COMMAND = 'hg'
     ARGS = ['hg']
+    STATUS_ARGS = ['status']
 
     def command_update(self, **kw):
         self.launch(['update'], **kw)
@@ -755,28 +1470,284 @@ class Mercurial(VersionControlSystem):
     
 
 
+class VcsStatus(object):
+    """
+    The status of the files of a working copy, collected by running the
+    status command of its version control system in a worker thread.
+
+    The whole working copy is queried once. After that, files are queried
+    again only when they have been modified since, or have gone, as their
+    directory is listed or their buffer left.
+    """
+
+    def __init__(self, vcsmap, root):
+        """
+        @type vcsmap: L{VersionControlSystem}
+        @param root: The working copy root, where the command is run.
+        """
+        self.vcsmap = vcsmap
+        self.root = os.path.normpath(root)
+        # path -> status letter
+        self.statuses = {}
+        # The directories with changed files below them
+        self.changed_dirs = {}
+        # path -> the time it was last queried
+        self.queried = {}
+        # The time the whole working copy was queried, or None
+        self.queried_all = None
+        # (directory, paths), with paths None for the whole working copy
+        self.jobs = []
+        self.running = False
+        self.callbacks = []
+
+    def subscribe(self, callback):
+        self.callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.callbacks:
+            self.callbacks.remove(callback)
+
+    def contains(self, path):
+        return path == self.root or path.startswith(self.root + os.path.sep)
+
+    def get(self, path):
+        """
+        Return the status letter of a path, "*" for a directory with changes
+        below it, or None.
+        """
+        path = os.path.normpath(path)
+        status = self.statuses.get(path)
+        if status is None and path in self.changed_dirs:
+            status = '*'
+        return status
+
+    def refresh(self):
+        """ Query the whole working copy again. """
+        self.add_job(None, None)
+
+    def check(self, directory, paths):
+        """
+        Query the files listed in a directory that may have changed, and
+        those with a status no longer listed.
+        """
+        self.add_job(os.path.normpath(directory), paths)
+
+    def check_files(self, paths):
+        self.add_job(None, paths)
+
+    def add_job(self, directory, paths):
+        if paths is not None:
+            if not paths:
+                return
+            if self.queried_all is None and self.running:
+                # The whole working copy is being queried
+                return
+        self.jobs.append((directory, paths))
+        if not self.running:
+            self.start_next()
+
+    def start_next(self):
+        self.running = True
+        directory, paths = self.jobs.pop(0)
+        worker = threading.Thread(target=self.run, args=(directory, paths))
+        worker.setDaemon(True)
+        worker.start()
+
+    def get_stale(self, directory, paths):
+        """
+        Return which paths may have changed since they were last queried.
+        """
+        stale = []
+        for path in paths:
+            path = os.path.normpath(path)
+            if not self.contains(path):
+                continue
+            queried = self.queried.get(path, self.queried_all)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                mtime = None
+            if queried is None or mtime is None or mtime >= queried:
+                stale.append(path)
+        if directory is not None:
+            listed = dict.fromkeys([os.path.normpath(p) for p in paths])
+            for path in self.statuses.keys():
+                if (os.path.dirname(path) == directory and
+                    not path in listed):
+                    stale.append(path)
+        return stale
+
+    def run(self, directory, paths):
+        # Run in the worker thread
+        started = time.time()
+        if paths is None:
+            args = self.vcsmap.get_status_command()
+        else:
+            paths = self.get_stale(directory, paths)
+            if not paths:
+                gobject.idle_add(self.cb_done, paths, [], started)
+                return
+            relpaths = [p[len(self.root):].lstrip(os.path.sep)
+                        for p in paths]
+            args = self.vcsmap.get_status_command(relpaths)
+        try:
+            output = self.get_output(args)
+        except (OSError, IOError), e:
+            # Nothing is known, so nothing is changed
+            gobject.idle_add(self.cb_done, [], [], started)
+            return
+        statuses = self.vcsmap.parse_status(output)
+        statuses = [(os.path.normpath(os.path.join(self.root, path)), status)
+                    for path, status in statuses]
+        gobject.idle_add(self.cb_done, paths, statuses, started)
+
+    def get_output(self, args):
+        """
+        Return the output of a status command, killing it if it takes
+        longer than VCS_STATUS_TIMEOUT. It has no input, so it cannot wait
+        on a password prompt.
+        """
+        devnull = open(os.devnull, 'r')
+        try:
+            proc = subprocess.Popen(args, cwd=self.root, stdin=devnull,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+        finally:
+            devnull.close()
+        timer = threading.Timer(VCS_STATUS_TIMEOUT, self.kill, [proc])
+        timer.start()
+        try:
+            output = proc.communicate()[0]
+        finally:
+            timer.cancel()
+        if proc.returncode < 0:
+            raise OSError, 'status command killed: %s' % ' '.join(args)
+        return output
+
+    def kill(self, proc):
+        try:
+            os.kill(proc.pid, signal.SIGTERM)
+        except OSError:
+            # Already finished
+            pass
+
+    def cb_done(self, paths, statuses, started):
+        if paths is None:
+            self.statuses = {}
+            self.queried = {}
+            self.queried_all = started
+        else:
+            for path in paths:
+                if path in self.statuses:
+                    del self.statuses[path]
+                self.queried[path] = started
+        for path, status in statuses:
+            self.statuses[path] = status
+        if paths is None or paths:
+            self.update_changed_dirs()
+            for callback in self.callbacks:
+                callback(self)
+        self.running = False
+        if self.jobs:
+            self.start_next()
+        return False
+
+    def update_changed_dirs(self):
+        changed_dirs = {}
+        for path, status in self.statuses.iteritems():
+            if status == '?':
+                continue
+            path = os.path.dirname(path)
+            while self.contains(path) and not path in changed_dirs:
+                changed_dirs[path] = True
+                parent = os.path.dirname(path)
+                if parent == path:
+                    break
+                path = parent
+        self.changed_dirs = changed_dirs
+
+# working copy root -> VcsStatus
+vcs_statuses = {}
+
+def get_vcs_status(vcsmap, root):
+    """
+    Return the status of a working copy, querying it when first asked.
+    """
+    vcs_status = vcs_statuses.get(root)
+    if vcs_status is None:
+        vcs_status = vcs_statuses[root] = VcsStatus(vcsmap, root)
+        vcs_status.refresh()
+    return vcs_status
+
 def create_vcs_maps(callbackfunc):
     return {VCS_DARCS: Darcs(callbackfunc),
             VCS_SVN: Subversion(callbackfunc),
             VCS_CVS: Cvs(callbackfunc),
             VCS_MERC: Mercurial(callbackfunc)}
 
-def get_vcs_for_directory(dirname):
-    vcs = 0
-    if os.path.exists(dirname) and os.path.isdir(dirname):
-        for i in os.listdir(dirname):
-            if i == '_darcs':
-                vcs = VCS_DARCS
-                break
-            elif i == '.svn':
-                vcs = VCS_SVN
+class VcsCache(object):
+    """
+    The version control system of directories, found by looking for the
+    marker directory of each system in a directory, then in its parents.
+
+    A result is kept until the modification time of one of the directories
+    looked in changes, as it does when a marker is added or removed.
+    """
+
+    def __init__(self):
+        # directory -> (vcs, root, [(directory looked in, mtime)])
+        self.found = {}
+
+    def get(self, dirname):
+        """
+        Return the version control system of a directory.
+
+        @return: The VCS_ constant and the directory the marker is in, or
+            VCS_NONE and None.
+        """
+        dirname = os.path.abspath(dirname)
+        cached = self.found.get(dirname)
+        if cached is not None and self.is_fresh(cached[2]):
+            return cached[0], cached[1]
+        vcs, root, checked = self.detect(dirname)
+        if checked:
+            self.found[dirname] = (vcs, root, checked)
+        return vcs, root
+
+    def detect(self, dirname):
+        checked = []
+        path = dirname
+        while True:
+            mtime = directory_cache.get_mtime(path)
+            if mtime is None:
                 break
-            elif i == 'CVS':
-                vcs = VCS_CVS
+            checked.append((path, mtime))
+            for marker, vcs in VCS_MARKERS:
+                if os.path.isdir(os.path.join(path, marker)):
+                    return vcs, path, checked
+            parent = os.path.dirname(path)
+            if parent == path:
                 break
-            elif i == '.hg':
-                vcs = VCS_MERC
-    return vcs
+            path = parent
+        return VCS_NONE, None, checked
+
+    def is_fresh(self, checked):
+        for path, mtime in checked:
+            if not directory_cache.is_fresh(path, mtime):
+                return False
+        return True
+
+vcs_cache = VcsCache()
+
+def get_vcs_for_directory(dirname):
+    return vcs_cache.get(dirname)[0]
+
+def get_vcs_root_for_directory(dirname):
+    """
+    Return the directory holding the version control marker found for a
+    directory, or None.
+    """
+    return vcs_cache.get(dirname)[1]
 
 def get_vcs_name_for_directory(dirname):
     return VCS[get_vcs_for_directory(dirname)]
@@ -54,12 +54,18 @@ class DefTree(gtkextra.Tree):
                ('line', gobject.TYPE_INT, None, False, None),
                ('column', gobject.TYPE_INT, None, False, None)]
 
-    def populate(self, rootnodes, parent=None):
+    KEY_COLUMN = 0
+
+    def populate(self, rootnodes, parent=None, parentkey=None):
+        rootnodes = list(rootnodes)
+        rows = []
         for node in rootnodes:
             b = self.beautify(node)
             col = node.getLine(0).index(node.name)
-            prnt = self.add_item([node.name, b, node.linenum, col], parent)
-            self.populate(node.getChildNodes(), prnt)
+            rows.append([node.name, b, node.linenum, col])
+        items = self.update_items(rows, parent, parentkey)
+        for node, (niter, key) in zip(rootnodes, items):
+            self.populate(node.getChildNodes(), niter, key)
 
     def beautify(self, el):
         mu = ('<span size="small"><span%s><b><i>%s</i></b></span>  '
@@ -82,13 +88,17 @@ class RefTree(gtkextra.Tree):
                 'markup'),
                ('line', gobject.TYPE_INT, None, False, None),
                ('column', gobject.TYPE_INT, None, False, None)]
+    FILTER_COLUMN = 0
 
     def populate(self, nodes):
-        self.clear()
+        rows = []
         for node in nodes:
             b = self.beautify(node)
-            self.add_item([node.filename, b, node.lineno, node.colno])
-        self.update()
+            rows.append([node.filename, b, node.lineno, node.colno])
+        self.update_items(rows)
+
+    def get_row_key(self, row):
+        return row[0], row[2], row[3]
 
     def beautify(self, element):
         rel = ('<span size="small"><span weight="bold">%s</span>'
@@ -112,13 +122,8 @@ class Plugin(plugin.Plugin):
     NAME = "python_browser"
 
     def configure(self, reg):
-        self.registry = reg.add_group('python_browser',
-            'The Python sopurce code browser.')
-        self.registry.add('use_colors',
-            registry.Boolean,
-            1,
-            'Whether colors will be used in the definition list')
-      
+        # The group is declared by the plugin manifest
+        self.registry = reg.python_browser
 
     def populate_widgets(self):
 
@@ -163,7 +168,6 @@ class Plugin(plugin.Plugin):
         f = open(fn)
         root = fastparser.fastparser(f.read())
         f.close()
-        self.defs.clear()
         self.defs.populate(root.getChildNodes())
    
     def refresh_refs(self, refs, label="References"):
@@ -226,7 +230,7 @@ class Plugin(plugin.Plugin):
         if name.endswith('py') and os.path.exists(name):
             self.refresh_defs(name)
         else:
-            self.defs.model.clear()
+            self.defs.clear()
 
     def evt_bufferexecute(self, *args):
         self.execute()
@@ -50,11 +50,14 @@ SCRIPT_DIR = script_directory()
 
 class DetailsWindow(gtk.Window):
 
-    def __init__(self, treemodel):
+    def __init__(self, pstats):
         gtk.Window.__init__(self)
         self.set_title('PIDA Profiler Detailed View')
         self.set_size_request(640, 400)
-        self.treeview = gtk.TreeView(treemodel)
+        self.pstats = pstats
+        self.sort_column = None
+        self.sort_reverse = False
+        self.treeview = gtk.TreeView(pstats.model)
         self.treeview.set_headers_clickable(True)
         self.treeview.set_rules_hint(True)
         sw = gtk.ScrolledWindow()
@@ -68,13 +71,26 @@ class DetailsWindow(gtk.Window):
             #column.set_sizing(gtk.TREE_VIEW_COLUMN_AUTOSIZE)
             column.set_expand(False)
             column.set_clickable(True)
-            column.set_sort_column_id(i+1)
             column.set_resizable(True)
-            #column.connect('clicked', self.cb_col_clicked)
+            column.connect('clicked', self.cb_col_clicked, i+1)
             self.treeview.append_column(column)
 
-    def cb_col_clicked(self, col):
-        pass
+    def cb_col_clicked(self, col, colid):
+        # The records are sorted, in a model of this window's own
+        if self.sort_column == colid:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = colid
+            self.sort_reverse = False
+        model = self.pstats.make_virtual_model(lambda r: r[colid],
+                                               self.sort_reverse)
+        self.treeview.set_model(model)
+        for column in self.treeview.get_columns():
+            column.set_sort_indicator(column is col)
+        if self.sort_reverse:
+            col.set_sort_order(gtk.SORT_DESCENDING)
+        else:
+            col.set_sort_order(gtk.SORT_ASCENDING)
 
 
 class PstatsTree(gtkextra.Tree):
@@ -91,6 +107,24 @@ class PstatsTree(gtkextra.Tree):
                ('total per call', gobject.TYPE_FLOAT, None, False, None),
                ('cumulative time', gobject.TYPE_FLOAT, None, False, None),
                ('cumulative per call', gobject.TYPE_FLOAT, None, False, None)]
+    VIRTUAL = True
+    FILTER_COLUMN = 3
+
+    def get_virtual_value(self, record, column):
+        # The markup is built the first time the row is rendered
+        if column == 0 and record[0] is None:
+            record[0] = self.markup(*record[1:])
+        return record[column]
+
+    def markup(self, filename, line, func, ncalls, tott, totper, cumt,
+               cumper):
+        MU = ('<span size="small"><b>%s()</b> %s ('
+              '<span foreground="#0000c0">%s</span>) %s\n'
+              'N:<b>%s</b> T:<b>%s</b>/<b>%s</b> '
+              'C:<b>%s</b>/<b>%s</b></span>')
+        dn, fn = os.path.split(filename)
+        return MU % (cgi.escape(func), cgi.escape(fn),
+                     line, dn, ncalls, tott, totper, cumt, cumper)
                 
 
 class Plugin(plugin.Plugin):
@@ -128,43 +162,31 @@ class Plugin(plugin.Plugin):
         self.readbuf = ''
 
     def cb_details(self, *args):
-        dw = DetailsWindow(self.pstats.model)
+        dw = DetailsWindow(self.pstats)
         dw.show_all()
 
     def cb_sort_changed(self, *args):
         order = self.sortbox.get_active() + 1
-        direction = gtk.SORT_DESCENDING
-        if self.sortascending.get_active():
-            direction = gtk.SORT_ASCENDING
-        self.pstats.model.set_sort_column_id(order, direction)
+        descending = not self.sortascending.get_active()
+        self.pstats.sort_rows(lambda r: r[order], descending)
 
     def cb_alternative(self, *args):
         #if self.fn and self.fn.endswith('.py'):
         self.profiler.run(self.fn, self.cb_stats)
             
     def cb_stats(self, statsdict):
-        self.pstats.clear()
+        rows = []
         for k in statsdict:
             fn, line, func = k
             ncalls, pcalls, tottime, cumtime, callers = statsdict[k]
-            d, f = os.path.split(fn)
             totper = cumper = 0
             if ncalls > 0:
                 totper = tottime / ncalls
                 cumper = cumtime / ncalls
-            
-            mu = self.markup(f, d, line, func,
-                                ncalls, tottime, totper, cumtime, cumper)
-            self.pstats.add_item([mu, fn, line, func,
-                                ncalls, tottime, totper, cumtime, cumper])
-
-    def markup(self, fn, dn, line, func, ncalls, tott, totper, cumt, cumper):
-        MU = ('<span size="small"><b>%s()</b> %s ('
-              '<span foreground="#0000c0">%s</span>) %s\n'
-              'N:<b>%s</b> T:<b>%s</b>/<b>%s</b> '
-              'C:<b>%s</b>/<b>%s</b></span>')
-        return MU % (cgi.escape(func), cgi.escape(fn),
-                     line, dn, ncalls, tott, totper, cumt, cumper)
+            # The markup is left to the tree, for the rows it renders
+            rows.append([None, fn, line, func,
+                         ncalls, tottime, totper, cumtime, cumper])
+        self.pstats.set_rows(rows)
 
 
     def evt_bufferchange(self, nr, name):
@@ -173,6 +173,13 @@ class Plugin(plugin.Plugin):
 
     def do_init(self):
         self.shortcuts = Shortcuts(self.pida)
+        self.pida.filewatcher.watch(
+            self.prop_main_registry.files.shortcut_data.value(),
+            self.cb_shortcuts_file_changed)
+
+    def cb_shortcuts_file_changed(self, filename):
+        if self.shortcuts.load():
+            self.do_evt('shortcutschanged')
 
 
     def makewin(self):
@@ -293,7 +300,14 @@ class Shortcuts(base.pidaobject):
         f.close()
 
     def load(self):
-        ''' Load the option file from the configured location. '''
+        '''
+        Load the option file from the configured location.
+
+        Returns the names of the shortcuts added, changed or removed.
+        '''
+        old = {}
+        for section in self.sections():
+            old[section] = self.get(section)
         fn = self.cb.registry.files.shortcut_data.value()
         if fn and os.path.exists(fn):
             tempopts = ConfigParser.ConfigParser()
@@ -320,8 +334,19 @@ class Shortcuts(base.pidaobject):
                         else:
                             ctxs.append('0')
                     self.set(section, command, glob, icon, ctxs)
+            for section in self.sections():
+                if not tempopts.has_option(section, 'command'):
+                    self.config.remove_section(section)
         else:
             self.reset_defaults()
+        changed = []
+        for section in self.sections():
+            if old.get(section) != self.get(section):
+                changed.append(section)
+        for section in old:
+            if not self.config.has_section(section):
+                changed.append(section)
+        return changed
 
     def reset_defaults(self):
         DEF = [('Preview',
@@ -48,23 +48,20 @@ class Terminal(base.pidaobject, vte.Terminal):
     def do_init(self):
         vte.Terminal.__init__(self)
         ## set config stuff
+        trans, bg, fg, font = self.prop_main_registry.terminal.get_many(
+            'enable_transparency', 'background_color', 'foreground_color',
+            'font')
         # transparency
-        trans = self.prop_main_registry.terminal.enable_transparency.value()
         if trans:
             self.set_background_transparent(trans)
         # colors
         # get the colour map
         cmap = self.get_colormap()
-        # bg
-        c = self.prop_main_registry.terminal.background_color.value()
-        bgcol = cmap.alloc_color(c)
-        # fg
-        c = self.prop_main_registry.terminal.foreground_color.value()
-        fgcol = cmap.alloc_color(c)
+        bgcol = cmap.alloc_color(bg)
+        fgcol = cmap.alloc_color(fg)
         # set to the new values
         self.set_colors(fgcol, bgcol, [])
         #font
-        font = self.prop_main_registry.terminal.font.value()
         self.set_font_from_string(font)
         # set the default size really small
         self.set_size(60, 10)
@@ -251,17 +251,36 @@ class Plugin(plugin.Plugin):
             pass
             #self.cw.quit(self.currentserver)
 
-    def evt_reset(self):
+    def check_embedded(self):
         if self.embedded_value != self.prop_main_registry.layout.embedded_mode.value():
             self.message('Embedded mode setting has changed.\n'
                          'You must restart Pida.')
+            return True
+        return False
+
+    def evt_reset(self):
+        if self.check_embedded():
             return
         self.load_shortcuts()
         self.show_or_hide_serverlist()
 
+    def cb_embedded_changed(self, options):
+        self.check_embedded()
+
+    def cb_serverlist_changed(self, options):
+        self.show_or_hide_serverlist()
+
+    def cb_shortcuts_changed(self, options):
+        self.load_shortcuts()
+
     def evt_started(self, *args):
         self.cw = gdkvim.VimWindow()
         self.embedded_value = self.prop_main_registry.layout.embedded_mode.value()
+        reg = self.prop_main_registry
+        reg.subscribe(self.cb_embedded_changed, ('layout', 'embedded_mode'))
+        reg.subscribe(self.cb_serverlist_changed, ('vim', 'show_serverlist'))
+        for option in reg.vim_shortcuts:
+            option.subscribe(self.cb_shortcuts_changed)
         if self.is_embedded():
             self.launch()
 
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*- 
+# vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
+# $Id$
+#Copyright (c) 2005 Ali Afshar aafshar@gmail.com
+
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+
+#The above copyright notice and this permission notice shall be included in
+#all copies or substantial portions of the Software.
+
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+"""Searching the contents of the files of a project."""
+
+# System imports
+import os
+import re
+import threading
+try:
+    import multiprocessing
+except ImportError:
+    # Python older than 2.6, files are searched in one thread
+    multiprocessing = None
+
+# GTK imports
+import gobject
+
+# Files with a null byte in this many first bytes are taken as binary
+BINARY_SAMPLE = 1024
+
+# Larger files are skipped
+MAX_FILE_SIZE = 4 * 1024 * 1024
+
+# The search stops after this many hits
+MAX_HITS = 5000
+
+# The longest text shown of a matching line
+MAX_TEXT = 200
+
+# Files handed to a worker process at once
+CHUNK_SIZE = 16
+
+# pattern and flags -> compiled, in each worker process
+_compiled = {}
+
+def get_pattern(query, literal=False, ignorecase=False):
+    """
+    Return the pattern text and flags for a query.
+
+    @raise re.error: The query is not a valid regular expression.
+    """
+    if literal:
+        query = re.escape(query)
+    flags = re.MULTILINE
+    if ignorecase:
+        flags = flags | re.IGNORECASE
+    # Checked now, rather than failing in every worker
+    re.compile(query, flags)
+    return query, flags
+
+def search_file(task):
+    """
+    Return the hits of a pattern in a file.
+
+    This is run in the worker processes, so it is a function and takes a
+    single picklable argument.
+
+    @param task: The filename, pattern text and flags.
+    @return: The hits, as C{(filename, line, column, text)} with the line
+        counted from 1.
+    """
+    filename, pattern, flags = task
+    rx = _compiled.get((pattern, flags))
+    if rx is None:
+        rx = _compiled[(pattern, flags)] = re.compile(pattern, flags)
+    try:
+        if os.path.getsize(filename) > MAX_FILE_SIZE:
+            return []
+        f = open(filename, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+    except (IOError, OSError), e:
+        return []
+    if '\0' in data[:BINARY_SAMPLE]:
+        return []
+    # Most files have no match, and are only scanned once
+    if rx.search(data) is None:
+        return []
+    hits = []
+    lineno = 0
+    for line in data.splitlines():
+        lineno = lineno + 1
+        m = rx.search(line)
+        if m is not None:
+            hits.append((filename, lineno, m.start(),
+                         line.strip()[:MAX_TEXT]))
+    return hits
+
+def iter_files(root, exclude=None):
+    """
+    Yield the files under root, not entering or yielding the names exclude
+    matches.
+
+    @param exclude: The compiled pattern of names to leave out, or None.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        if exclude is not None:
+            dirnames[:] = [d for d in dirnames if not exclude.match(d)]
+        dirnames.sort()
+        filenames.sort()
+        for name in filenames:
+            if exclude is None or not exclude.match(name):
+                yield os.path.join(dirpath, name)
+
+class ProjectSearch(object):
+    """
+    A search of the files under a directory, run by a pool of worker
+    processes.
+
+    A thread feeds the pool. Its hits are collected and handed to the main
+    loop in batches, with at most one idle call waiting at a time.
+    """
+
+    def __init__(self, root, pattern, flags, exclude, hits_callback,
+                 done_callback):
+        """
+        @param exclude: The compiled pattern of names to leave out, or None.
+        @param hits_callback: Called in the main loop with a list of hits,
+            see L{search_file}.
+        @param done_callback: Called in the main loop with the search, when
+            it has finished or been cancelled.
+        """
+        self.root = root
+        self.pattern = pattern
+        self.flags = flags
+        self.exclude = exclude
+        self.hits_callback = hits_callback
+        self.done_callback = done_callback
+        self.cancelled = False
+        self.finished = False
+        self.files = 0
+        self.count = 0
+        self.lock = threading.Lock()
+        self.pending = []
+        self.scheduled = False
+
+    def start(self):
+        worker = threading.Thread(target=self.run)
+        worker.setDaemon(True)
+        worker.start()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def get_tasks(self):
+        for filename in iter_files(self.root, self.exclude):
+            if self.cancelled:
+                break
+            self.files = self.files + 1
+            yield filename, self.pattern, self.flags
+
+    def run(self):
+        try:
+            if multiprocessing is None:
+                self.run_serial()
+            else:
+                self.run_parallel()
+        finally:
+            self.finished = True
+            self.schedule()
+
+    def run_serial(self):
+        for task in self.get_tasks():
+            if not self.add_hits(search_file(task)):
+                break
+
+    def run_parallel(self):
+        pool = multiprocessing.Pool()
+        try:
+            for hits in pool.imap_unordered(search_file, self.get_tasks(),
+                                            CHUNK_SIZE):
+                if not self.add_hits(hits):
+                    break
+        finally:
+            # Files queued for the workers are dropped
+            pool.terminate()
+
+    def add_hits(self, hits):
+        """
+        Queue hits for the main loop.
+
+        @return: Whether the search should go on.
+        """
+        if self.cancelled:
+            return False
+        if hits:
+            hits = hits[:MAX_HITS - self.count]
+            self.count = self.count + len(hits)
+            self.lock.acquire()
+            try:
+                self.pending.extend(hits)
+            finally:
+                self.lock.release()
+            self.schedule()
+        return self.count < MAX_HITS
+
+    def schedule(self):
+        self.lock.acquire()
+        try:
+            schedule = not self.scheduled
+            self.scheduled = True
+        finally:
+            self.lock.release()
+        if schedule:
+            gobject.idle_add(self.cb_deliver)
+
+    def cb_deliver(self):
+        self.lock.acquire()
+        try:
+            hits = self.pending
+            self.pending = []
+            self.scheduled = False
+            finished = self.finished
+        finally:
+            self.lock.release()
+        if self.cancelled:
+            if finished:
+                self.done_callback(self)
+            return False
+        if hits:
+            self.hits_callback(hits)
+        if finished:
+            self.done_callback(self)
+        return False
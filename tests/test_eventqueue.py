@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*- 
+# vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
+
+"""Tests for the deferred event queue."""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+try:
+    import gobject
+except ImportError:
+    # The queue only schedules its flush with gobject, which the tests do
+    # by hand
+    import imp
+    gobject = imp.new_module('gobject')
+    gobject.idle_add = lambda func, *args: 1
+    gobject.source_remove = lambda source_id: True
+    sys.modules['gobject'] = gobject
+
+import eventqueue
+
+class EventQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.delivered = []
+        self.queue = eventqueue.EventQueue(self.deliver,
+                                           {'filetype': 'bufferchange'})
+
+    def deliver(self, name, args, kw):
+        self.delivered.append((name,) + args)
+
+    def push(self, name, key, *args):
+        self.queue.push(name, key, args, {})
+
+    def test_latest_kept(self):
+        self.push('bufferchange', None, 1, 'a.py')
+        self.push('bufferlist', None, [])
+        self.push('bufferchange', None, 2, 'b.py')
+        self.queue.flush()
+        self.assertEqual(self.delivered, [('bufferlist', []),
+                                          ('bufferchange', 2, 'b.py')])
+
+    def test_filetype_dropped_with_its_bufferchange(self):
+        # Buffer 2 has no filetype, so buffer 1's must not precede it
+        self.push('filetype', 1, 1, 'python')
+        self.push('bufferchange', None, 1, 'a.py')
+        self.push('bufferchange', None, 2, 'b.txt')
+        self.queue.flush()
+        self.assertEqual(self.delivered, [('bufferchange', 2, 'b.txt')])
+
+    def test_filetype_before_its_bufferchange(self):
+        self.push('filetype', 1, 1, 'python')
+        self.push('bufferchange', None, 1, 'a.py')
+        self.push('filetype', 2, 2, 'c')
+        self.push('bufferchange', None, 2, 'b.c')
+        self.queue.flush()
+        self.assertEqual(self.delivered, [('filetype', 2, 'c'),
+                                          ('bufferchange', 2, 'b.c')])
+
+    def test_unclaimed_filetype_delivered(self):
+        self.push('bufferchange', None, 1, 'a.py')
+        self.push('filetype', 2, 2, 'c')
+        self.queue.flush()
+        self.assertEqual(self.delivered, [('bufferchange', 1, 'a.py'),
+                                          ('filetype', 2, 'c')])
+        self.failIf(self.queue.has_pending())
+
+if __name__ == '__main__':
+    unittest.main()